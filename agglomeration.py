@@ -0,0 +1,121 @@
+import numpy as np  # Import numpy for the vectorized distance updates
+
+import instrumentation
+from kdtree import KDTree
+
+chunk_limit = 2_048     # Default and largest chunk size of d-dimensional input, the merges of a chunk cost O(m^2 d)
+merge_limit = 16_384    # Largest number of summaries merged at once; more are first merged group by group
+
+
+def agglomerate(centroids, counts, k):
+    """
+        Merges the closest pair of clusters until k clusters remain, for clusters of any dimension.
+
+        This is the centroid linkage of clustering_heap on arrays: two clusters merge into the weighted
+        mean of their centroids. Every cluster keeps its closest other cluster, found for all clusters at
+        once with a KDTree, and the squared distance to it. A merge computes the distances of the merged
+        cluster to all clusters in one vectorized step, and every cluster closer to it than to its kept
+        cluster points at it. The other clusters that pointed at one of the merged clusters keep their old
+        distance as a lower bound, as no remaining cluster is closer than that, and only search again
+        when their bound is the smallest of all. In high dimensions many clusters share the same closest
+        cluster, so searching for all of them after every merge would cost a full scan each.
+
+        Parameters:
+            centroids: (m, d) array of cluster centroids.
+            counts: Number of points of every cluster.
+            k: Number of clusters to keep.
+
+        Returns:
+            The (k, d) array of the merged centroids and the array of their numbers of points.
+        """
+    centroids = np.array(centroids, dtype=float).reshape(len(centroids), -1)
+    counts = np.array(counts, dtype=float)
+    m = len(centroids)
+    if m <= k:
+        return centroids, counts
+
+    active = np.ones(m, dtype=bool)
+    exact = np.ones(m, dtype=bool)     # False while the kept distance is only a lower bound
+    nearest, distances = KDTree(centroids).query(centroids, exclude_rows=np.arange(m))
+    nearest_squared = distances ** 2
+
+    def distances_to(row):
+        """Computes the squared distances of one cluster to all active clusters, infinite for the others."""
+        instrumentation.count("vectorized_distances", m)
+        difference = centroids - centroids[row]
+        squared = np.einsum("ij,ij->i", difference, difference)
+        squared[~active] = np.inf
+        squared[row] = np.inf
+        return squared
+
+    merges = 0
+    while merges < m - k:
+        a = int(nearest_squared.argmin())
+        if not exact[a]:
+            squared = distances_to(a)
+            nearest[a] = squared.argmin()
+            nearest_squared[a], exact[a] = squared[nearest[a]], True
+            continue
+
+        b = int(nearest[a])
+        merges += 1
+        instrumentation.count("agglomeration_merges")
+
+        # The merged cluster takes the slot of a
+        total = counts[a] + counts[b]
+        centroids[a] = (centroids[a] * counts[a] + centroids[b] * counts[b]) / total
+        counts[a], counts[b] = total, 0
+        active[b] = False
+        nearest_squared[b] = np.inf
+
+        squared = distances_to(a)
+        nearest[a] = squared.argmin()
+        nearest_squared[a] = squared[nearest[a]]
+        stale = active & ((nearest == a) | (nearest == b))
+        stale[a] = False
+        closer = squared < nearest_squared
+        closer |= stale & (squared <= nearest_squared)
+        nearest[closer], nearest_squared[closer], exact[closer] = a, squared[closer], True
+        exact[stale & ~closer] = False
+
+    return centroids[active], counts[active]
+
+
+def cluster_chunk(task):
+    """
+        Reduces one chunk of d-dimensional points to k clusters, run in a worker process.
+
+        Parameters:
+            task: Tuple (chunk array, k).
+
+        Returns:
+            A list of (centroid, number of points, sum of x, sum of y, ...) summaries of the clusters.
+        """
+    chunk, k = task
+    centroids, counts = agglomerate(chunk, np.ones(len(chunk)), k)
+    sums = centroids * counts[:, None]
+    return [(tuple(centroid), count, *sum_row)
+            for centroid, count, sum_row in zip(centroids.tolist(), counts.tolist(), sums.tolist())]
+
+
+def merge_summaries(centroids, counts, k):
+    """
+        Merges summarized clusters into k clusters, first group by group while there are more than merge_limit.
+
+        Parameters:
+            centroids: (m, d) array of cluster centroids.
+            counts: Number of points of every cluster.
+            k: Number of clusters to keep.
+
+        Returns:
+            The (k, d) array of the merged centroids and the array of their numbers of points.
+        """
+    centroids = np.asarray(centroids, dtype=float)
+    counts = np.asarray(counts, dtype=float)
+    group_size = max(merge_limit // 2, 2 * k)
+    while len(centroids) > max(merge_limit, 2 * k):
+        groups = [agglomerate(centroids[start:start + group_size], counts[start:start + group_size], k)
+                  for start in range(0, len(centroids), group_size)]
+        centroids = np.concatenate([group[0] for group in groups])
+        counts = np.concatenate([group[1] for group in groups])
+    return agglomerate(centroids, counts, k)
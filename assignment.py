@@ -0,0 +1,78 @@
+import numpy as np  # Import numpy for the vectorized bound checks
+
+
+class HamerlyAssigner:
+    """
+        Assigns a fixed set of points to the closest of k moving centers using Hamerly's bounds.
+
+        Every point keeps an upper bound on the distance to its assigned center and a lower bound on the
+        distance to every other center. When the centers move, the bounds are loosened by the distances
+        the centers moved; a point whose upper bound stays below both its lower bound and half the distance
+        from its center to the closest other center keeps its label without any distance evaluation.
+        The assignment of the previous call is reused as the starting point of the next one.
+        """
+    def __init__(self, points):
+        self.coordinates = np.asarray(points, dtype=float)
+        self.centers = None
+        self.labels = None
+        self.upper = None
+        self.lower = None
+        self.distance_evaluations = 0   # Number of point to center distances computed so far
+        self.passes = 0                 # Number of assign calls
+
+    def full_assignment(self, rows):
+        """Computes the distances of the given rows to all centers and resets their labels and bounds."""
+        distances = np.sqrt(((self.coordinates[rows, None, :] - self.centers[None, :, :]) ** 2).sum(axis=2))
+        self.distance_evaluations += distances.size
+
+        order = np.argsort(distances, axis=1)
+        positions = np.arange(len(rows))
+        self.labels[rows] = order[:, 0]
+        self.upper[rows] = distances[positions, order[:, 0]]
+        self.lower[rows] = distances[positions, order[:, 1]] if distances.shape[1] > 1 else np.inf
+
+    def assign(self, centers):
+        """
+            Assigns every point to its closest center.
+
+            Parameters:
+                centers: Sequence of k centers; center j must be the moved version of center j of the previous call.
+
+            Returns:
+                An array with the index of the closest center of every point.
+            """
+        centers = np.asarray(centers, dtype=float)
+        self.passes += 1
+        n = len(self.coordinates)
+
+        if self.centers is None or len(centers) != len(self.centers):
+            self.centers = centers
+            self.labels = np.zeros(n, dtype=np.intp)
+            self.upper = np.empty(n)
+            self.lower = np.empty(n)
+            self.full_assignment(np.arange(n))
+            return self.labels
+
+        # Loosen the bounds by the movement of the centers
+        shift = np.sqrt(((centers - self.centers) ** 2).sum(axis=1))
+        self.centers = centers
+        self.upper += shift[self.labels]
+        self.lower -= shift.max()
+
+        # Half the distance from every center to its closest other center
+        between = np.sqrt(((centers[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2))
+        np.fill_diagonal(between, np.inf)
+        half_gap = between.min(axis=1) / 2 if len(centers) > 1 else np.full(1, np.inf)
+
+        bound = np.maximum(half_gap[self.labels], self.lower)
+        rows = np.flatnonzero(self.upper > bound)
+
+        # Tighten the upper bound of the remaining points before falling back to all centers
+        tight = np.sqrt(((self.coordinates[rows] - centers[self.labels[rows]]) ** 2).sum(axis=1))
+        self.distance_evaluations += len(rows)
+        self.upper[rows] = tight
+        rows = rows[tight > bound[rows]]
+
+        if len(rows):
+            self.full_assignment(rows)
+        return self.labels
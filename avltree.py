@@ -1,12 +1,16 @@
-from util import compute_distance
+import random
+
+import instrumentation
+from util import squared_distance
 
 spaces_increment_value = 5
 
 class AVLNode:
-    """Represents a node in an AVL Tree with a 2D point (x, y) and properties for height and children nodes."""
+    """Represents a node in an AVL Tree with a 2D point (x, y) and properties for height, size and children nodes."""
     def __init__(self, x, y, points = None):
         self.point = (x, y) # Point represented as a tuple
         self.height = 1     # Height of the node in the tree for balancing
+        self.size = 1       # Number of nodes in the subtree rooted at this node
         self.left = None    # Left child
         self.right = None   # Right child
         self.points = points if points is not None else [] # Cluster points
@@ -29,16 +33,41 @@ def get_height(node):
     return node.height if node is not None else 0
 
 
+def get_size(node):
+    """Returns the number of nodes in the subtree of a node, or 0 if the node is None."""
+    return node.size if node is not None else 0
+
+
 def find_closest(root, node, best = None):
     """Finds the closest node to a given node in the AVL tree."""
-    if root is None or node is None:
+    if node is None:
         return best
 
+    best_squared = squared_distance(node.point, best.point) if best is not None else float("inf")
+    return closest_in_subtree(root, node, best, best_squared)[0]
+
+
+def closest_in_subtree(root, node, best, best_squared):
+    """
+        Recursive search of find_closest.
+
+        The squared distance of the best node so far is carried along, so every visited node costs one
+        squared distance and no square root is taken.
+
+        Returns:
+            The closest node found so far and its squared distance to the given node.
+        """
+    if root is None:
+        return best, best_squared
+
+    if instrumentation.active is not None:
+        instrumentation.active.count("find_closest_visits")
+
     if root != node:
-        distance = compute_distance(root.point, node.point)
+        squared = squared_distance(root.point, node.point)
         # Update best if current node is closer and not the same as the input node
-        if best is None or distance < compute_distance(node.point, best.point):
-            best = root
+        if best is None or squared < best_squared:
+            best, best_squared = root, squared
 
     if node.point < root.point:
         next_node = root.left
@@ -48,15 +77,13 @@ def find_closest(root, node, best = None):
         last_node = root.left
 
     # Recurse to find a closer point
-    temp = find_closest(next_node, node, best)
-    best = temp if temp is not None else best
+    best, best_squared = closest_in_subtree(next_node, node, best, best_squared)
 
     # Check if exploring the other subtree might yield a closer node
-    if abs(node.point[0] - root.point[0]) < compute_distance(node.point, best.point):
-        temp = find_closest(last_node, node, best)
-        best = temp if temp is not None else best
+    if (node.point[0] - root.point[0]) ** 2 < best_squared:
+        best, best_squared = closest_in_subtree(last_node, node, best, best_squared)
 
-    return best
+    return best, best_squared
 
 
 def get_balance(node):
@@ -65,19 +92,42 @@ def get_balance(node):
 
 
 def update_height(node):
-    """Updates the height of a node based on its children's heights."""
+    """Updates the height and the subtree size of a node based on its children."""
     node.height = 1 + max(get_height(node.left), get_height(node.right))
+    node.size = 1 + get_size(node.left) + get_size(node.right)
 
 
 def count_elements(node):
-    """Counts the total number of nodes in the tree."""
-    if not node:
-        return 0
-    return 1 + count_elements(node.left) + count_elements(node.right)
+    """Counts the total number of nodes in the tree in O(1) using the subtree size."""
+    return get_size(node)
+
+
+def select(root, rank):
+    """Returns the node at the given 0-based rank of the in-order traversal in O(log n)."""
+    if not 0 <= rank < get_size(root):
+        raise IndexError("rank out of range")
+
+    node = root
+    while True:
+        left_size = get_size(node.left)
+        if rank < left_size:
+            node = node.left
+        elif rank == left_size:
+            return node
+        else:
+            rank -= left_size + 1
+            node = node.right
+
+
+def sample_nodes(root, amount, rng = random):
+    """Returns amount distinct nodes chosen uniformly at random in O(amount log n) without flattening the tree."""
+    return [select(root, rank) for rank in rng.sample(range(get_size(root)), amount)]
 
 
 def rotate_right(node):
     """Performs a right rotation on the given node."""
+    if instrumentation.active is not None:
+        instrumentation.active.count("avl_rotations")
     l = node.left
     lr = l.right
     l.right = node
@@ -90,6 +140,8 @@ def rotate_right(node):
 
 def rotate_left(node):
     """Performs a left rotation on the given node."""
+    if instrumentation.active is not None:
+        instrumentation.active.count("avl_rotations")
     r = node.right
     rl = r.left
     r.left = node
@@ -130,6 +182,41 @@ def insert(node, x, y, points = None):
     return node
 
 
+def build_tree(points, payloads = None, presorted = False):
+    """
+        Builds a perfectly balanced AVL tree from a whole collection of points at once.
+
+        The points are sorted once (skipped when presorted) and duplicates are dropped like insert does;
+        the tree is then built from the sorted sequence in linear time.
+
+        Parameters:
+            points: Sequence of points (x, y).
+            payloads: Optional sequence of cluster points aligned with points.
+            presorted: Whether the points are already in ascending order.
+
+        Returns:
+            The root of the tree, or None if there are no points.
+        """
+    items = list(zip(points, payloads)) if payloads is not None else [(point, None) for point in points]
+    if not presorted:
+        items.sort(key=lambda item: item[0])
+    items = [item for i, item in enumerate(items) if i == 0 or item[0] != items[i - 1][0]]
+
+    def build(low, high):
+        if low >= high:
+            return None
+        middle = (low + high) // 2
+        node = AVLNode(*items[middle][0], items[middle][1])
+        node.left = build(low, middle)
+        node.right = build(middle + 1, high)
+        # A range split at the middle yields a tree of height bit_length(n)
+        node.height = (high - low).bit_length()
+        node.size = high - low
+        return node
+
+    return build(0, len(items))
+
+
 def min_value_node(node):
     """Finds the node with the minimum point value in the AVL tree."""
     current = node
@@ -190,6 +277,7 @@ def tree_to_list(root, tree_list = None):
 
     if tree_list is None:
         tree_list = []
+        instrumentation.count("tree_to_list")
 
     tree_to_list(root.left, tree_list)
     tree_list.append(root)
@@ -0,0 +1,53 @@
+"""
+    Distance evaluation counts of the k-medoids assignment on the main.py workload.
+
+    Runs the chunk stage of clustering_with_medoids with the Hamerly assigner and compares the
+    number of point to medoid distances it computed with a full recomputation, which evaluates
+    every point against every medoid twice per iteration.
+
+    Usage:
+        python benchmarks/bench_assignment.py [points] [k]
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clustering_with_medoids
+from assignment import HamerlyAssigner
+from util import generate_points
+
+assigners = []
+
+
+class RecordingAssigner(HamerlyAssigner):
+    """HamerlyAssigner that registers itself so its counters can be read after the run."""
+    def __init__(self, points):
+        super().__init__(points)
+        assigners.append(self)
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    random.seed(size)
+    points = generate_points(20, size + 20, (-5000, 5000), (-5000, 5000), (-100, 100), (-100, 100), seed=size)
+    points = [tuple(point) for point in points.tolist()]
+
+    clustering_with_medoids.HamerlyAssigner = RecordingAssigner
+    clustering_with_medoids.clustering_with_medoids(points, k, seed=size)
+
+    # The former loop assigned twice per iteration: once for the current and once for the new medoids
+    iterations = sum(assigner.passes - 1 for assigner in assigners)
+    full = sum(2 * (assigner.passes - 1) * len(assigner.coordinates) * k for assigner in assigners)
+    hamerly = sum(assigner.distance_evaluations for assigner in assigners)
+
+    print(f"points = {len(points)}, k = {k}, chunks = {len(assigners)}, iterations = {iterations}")
+    print(f"full recomputation: {full:>12} distance evaluations")
+    print(f"hamerly assigner:   {hamerly:>12} distance evaluations ({hamerly / full:.1%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+    Benchmark of the compact integer-coordinate mode against points stored as Python tuples.
+
+    Generates clustered integer points and reports the memory per point of a list of tuples, a float64
+    array and a compact int32 array, followed by the nearest-neighbour throughput of labelling the points
+    with their closest of k centers: the tuple path of the pipelines (grid index batch queries) against
+    the blocked squared-distance kernel on float64 and int32 arrays. Finally, the closest-point search of
+    both AVL trees is timed on a smaller tree.
+
+    Usage:
+        python benchmarks/bench_compact.py [--points 10000000] [--k 20] [--tuple-points 1000000]
+                                           [--tree-points 200000] [--queries 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import avltree
+import compact_avltree
+from spatial_index import build_grid
+from util import generate_points, nearest_center_labels, point_file_header
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Memory and nearest-neighbour throughput of the compact int32 mode.")
+    parser.add_argument("--points", type=int, default=10_000_000, help="number of generated points")
+    parser.add_argument("--k", type=int, default=20, help="number of centers the points are labelled with")
+    parser.add_argument("--tuple-points", type=int, default=1_000_000, help="points labelled on the slower tuple path, 0 for all")
+    parser.add_argument("--tree-points", type=int, default=200_000, help="points of the trees of the closest-point search")
+    parser.add_argument("--queries", type=int, default=2_000, help="closest-point queries per tree")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def tuple_bytes(points):
+    """Returns the size of the points as a list of tuples of Python ints, as built by tolist."""
+    # Every tuple owns its ints except for the small ints CPython caches
+    cached = np.count_nonzero((points >= -5) & (points <= 256))
+    return (sys.getsizeof([None] * len(points)) + len(points) * sys.getsizeof((0, 0))
+            + (points.size - cached) * sys.getsizeof(5000))
+
+
+def throughput(function, amount):
+    start_time = time.perf_counter()
+    function()
+    return amount / (time.perf_counter() - start_time)
+
+
+def main():
+    arguments = parse_arguments()
+    points = generate_points(20, arguments.points, (-5000, 5000), (-5000, 5000), (-100, 100), (-100, 100),
+                             seed=arguments.seed, dtype=np.int32)
+    floats = points.astype(float)
+    centers = floats[np.random.default_rng(arguments.seed).choice(len(points), arguments.k, replace=False)]
+
+    print(f"{len(points)} points")
+    print(f"{'layout':>14} {'bytes/point':>12} {'total MB':>9}")
+    layouts = (
+        ("tuples", tuple_bytes(points)),
+        ("float64 array", floats.nbytes),
+        ("int32 array", points.nbytes),
+        ("int32 file", point_file_header.size + points.nbytes),
+    )
+    for name, size in layouts:
+        print(f"{name:>14} {size / len(points):>12.1f} {size / 2 ** 20:>9.1f}")
+
+    tuple_amount = arguments.tuple_points or len(points)
+    tuples = [tuple(point) for point in points[:tuple_amount].tolist()]
+    grid = build_grid([tuple(center) for center in centers.tolist()])
+
+    print(f"\nlabelling with the closest of {arguments.k} centers")
+    print(f"{'path':>14} {'points':>9} {'points/s':>12} {'speedup':>8}")
+    baseline = throughput(lambda: grid.nearest_batch(tuples), len(tuples))
+    paths = (
+        ("tuples + grid", len(tuples), baseline),
+        ("float64 array", len(points), throughput(lambda: nearest_center_labels(floats, centers), len(points))),
+        ("int32 array", len(points), throughput(lambda: nearest_center_labels(points, centers), len(points))),
+    )
+    for name, amount, rate in paths:
+        print(f"{name:>14} {amount:>9} {rate:>12.0f} {rate / baseline:>8.1f}")
+
+    del tuples, floats
+    tree_points = [tuple(point) for point in points[:arguments.tree_points].tolist()]
+    queries = random.Random(arguments.seed).sample(tree_points, min(arguments.queries, len(tree_points)))
+    sys.setrecursionlimit(10_000)
+
+    print(f"\nclosest point among {len(tree_points)} points")
+    print(f"{'tree':>14} {'us/query':>9}")
+    for name, module in (("avltree", avltree), ("compact", compact_avltree)):
+        root = module.build_tree(tree_points)
+        start_time = time.perf_counter()
+        for point in queries:
+            module.find_closest(root, avltree.AVLNode(*point))
+        print(f"{name:>14} {(time.perf_counter() - start_time) / len(queries) * 1e6:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+    Benchmark of the object-based AVL tree against the array-backed compact AVL tree.
+
+    For every size, inserts shuffled unique points into both trees, then removes half of them,
+    and reports the memory per node and the insert/remove throughput.
+
+    Usage:
+        python benchmarks/bench_compact_avltree.py [size ...]
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import avltree
+import compact_avltree
+
+
+def measure(module, points):
+    # Memory is measured on a separate build, tracing allocations would distort the timings
+    tracemalloc.start()
+    root = None
+    for point in points:
+        root = module.insert(root, *point)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start_time = time.perf_counter()
+    root = None
+    for point in points:
+        root = module.insert(root, *point)
+    insert_time = time.perf_counter() - start_time
+
+    removed = points[::2]
+    start_time = time.perf_counter()
+    for point in removed:
+        root = module.remove_node(root, avltree.AVLNode(*point))
+    remove_time = time.perf_counter() - start_time
+
+    return memory / len(points), len(points) / insert_time, len(removed) / remove_time
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [100_000, 1_000_000]
+    sys.setrecursionlimit(10_000)
+
+    print(f"{'points':>9} {'tree':>8} {'bytes/node':>11} {'inserts/s':>11} {'removes/s':>11}")
+    for size in sizes:
+        random.seed(size)
+        points = list({(random.randint(-5000, 5000), random.randint(-5000, 5000)) for _ in range(size)})
+        random.shuffle(points)
+
+        for name, module in (("avltree", avltree), ("compact", compact_avltree)):
+            memory, inserts, removes = measure(module, points)
+            print(f"{len(points):>9} {name:>8} {memory:>11.1f} {inserts:>11.0f} {removes:>11.0f}")
+
+
+if __name__ == '__main__':
+    main()
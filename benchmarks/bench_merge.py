@@ -0,0 +1,46 @@
+"""
+    Benchmark of the agglomerative merge engines in clustering_with_centroids.
+
+    Builds one chunk of generated points and reduces it to k clusters with the original
+    sampling loop and with the heap-driven engine, printing the time of each.
+
+    Usage:
+        python benchmarks/bench_merge.py [k]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from avltree import insert
+from clustering_with_centroids import merge_engines
+from util import generate_points
+
+
+def build_tree(points):
+    root = None
+    for point in points:
+        root = insert(root, *point, [point])
+    return root
+
+
+def main():
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    print(f"{'points':>8} {'engine':>8} {'seconds':>10}")
+    for size in (500, 1_000, 2_000, 4_000):
+        random.seed(size)
+        points = generate_points(20, size, (-5000, 5000), (-5000, 5000), (-100, 100), (-100, 100), seed=size)
+        points = [tuple(point) for point in points.tolist()]
+
+        for name, engine in merge_engines.items():
+            root = build_tree(points)
+            start_time = time.perf_counter()
+            engine(root, k)
+            print(f"{size:>8} {name:>8} {time.perf_counter() - start_time:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+    Benchmark of the d-dimensional clustering engine across dimensions.
+
+    Generates Gaussian blobs in every dimension and reports the build time of the KDTree and its nearest
+    neighbour throughput against a brute-force scan of all points with one matrix product per block of
+    queries, checking that both find points at the same distance. Then both pipelines cluster the blobs
+    and report their time and the inertia per point against the noise of the blobs, the inertia per point
+    of their true centers. Dimension 2 runs the original AVL tree and grid index path of the pipelines, as
+    a reference for the other dimensions.
+
+    Usage:
+        python benchmarks/bench_ndim.py [--dimensions 2 4 8 16 32] [--points 200000] [--queries 2000]
+                                        [--pipeline-points 20000] [--k 10]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from clustering_with_centroids import clustering_with_centroids
+from clustering_with_medoids import clustering_with_medoids
+from evaluation import evaluate
+from kdtree import KDTree
+from util import nearest_center_labels
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="KDTree throughput and pipeline quality across dimensions.")
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[2, 4, 8, 16, 32], help="dimensions of the points")
+    parser.add_argument("--points", type=int, default=200_000, help="points of the KDTree")
+    parser.add_argument("--queries", type=int, default=2_000, help="nearest neighbour queries per tree")
+    parser.add_argument("--pipeline-points", type=int, default=20_000, help="points clustered by the pipelines")
+    parser.add_argument("--k", type=int, default=10, help="number of blobs and clusters")
+    parser.add_argument("--spread", type=float, default=50.0, help="standard deviation of the blobs per coordinate")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def blobs(amount, dimensions, k, spread, rng):
+    """Returns amount points around k random centers in [-1000, 1000]^d and the inertia per point of those centers."""
+    centers = rng.uniform(-1000, 1000, (k, dimensions))
+    labels = rng.integers(0, k, amount)
+    points = centers[labels] + rng.normal(0, spread, (amount, dimensions))
+    return points, float(((points - centers[labels]) ** 2).sum()) / amount
+
+
+def timed(function):
+    start_time = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start_time
+
+
+def main():
+    arguments = parse_arguments()
+    rng = np.random.default_rng(arguments.seed)
+
+    print(f"nearest neighbour among {arguments.points} points, {arguments.queries} queries")
+    print(f"{'d':>3} {'build s':>8} {'tree q/s':>10} {'scan q/s':>10} {'speedup':>8} {'same':>5}")
+    for dimensions in arguments.dimensions:
+        points, _ = blobs(arguments.points, dimensions, arguments.k, arguments.spread, rng)
+        queries = points[rng.choice(len(points), arguments.queries, replace=False)] + rng.normal(0, 1, (arguments.queries, dimensions))
+
+        tree, build_time = timed(lambda: KDTree(points))
+        (_, distances), tree_time = timed(lambda: tree.query(queries))
+        block_size = max(1, 4_000_000 // len(points))   # Bounds the queries x points score block
+        rows, scan_time = timed(lambda: nearest_center_labels(queries, points, block_size))
+        same = np.allclose(distances, np.sqrt(((points[rows] - queries) ** 2).sum(axis=1)))
+        print(f"{dimensions:>3} {build_time:>8.2f} {len(queries) / tree_time:>10.0f} {len(queries) / scan_time:>10.0f} "
+              f"{scan_time / tree_time:>8.1f} {str(same):>5}")
+
+    print(f"\nclustering {arguments.pipeline_points} points into {arguments.k} clusters")
+    print(f"{'d':>3} {'algorithm':>10} {'seconds':>8} {'inertia/point':>14} {'noise/point':>12} {'ratio':>6}")
+    for dimensions in arguments.dimensions:
+        points, noise = blobs(arguments.pipeline_points, dimensions, arguments.k, arguments.spread, rng)
+        for name, function in (("centroids", clustering_with_centroids), ("medoids", clustering_with_medoids)):
+            (_, labels, centers), elapsed = timed(lambda: function(points, arguments.k, seed=arguments.seed,
+                                                                   return_labels=True))
+            inertia = evaluate(points, labels, centers)["inertia"] / len(points)
+            print(f"{dimensions:>3} {name:>10} {elapsed:>8.2f} {inertia:>14.1f} {noise:>12.1f} {inertia / noise:>6.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+    Scaling benchmark of the parallel chunk stage of both clustering pipelines.
+
+    Clusters the same generated points with 1, 2, 4, ... workers up to the number of CPUs
+    and reports the time and speedup of each run, checking that every run returns the
+    same clusters for the same seed.
+
+    Usage:
+        python benchmarks/bench_parallel.py [points] [k] [max workers]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clustering_with_centroids import clustering_with_centroids
+from clustering_with_medoids import clustering_with_medoids
+from util import generate_points
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    random.seed(size)
+    points = generate_points(20, size, (-5000, 5000), (-5000, 5000), (-100, 100), (-100, 100), seed=size)
+    points = [tuple(point) for point in points.tolist()]
+
+    cpus = os.cpu_count() or 1
+    max_workers = int(sys.argv[3]) if len(sys.argv) > 3 else cpus
+    worker_counts = sorted({1, max_workers} | {2 ** i for i in range(max_workers.bit_length()) if 2 ** i <= max_workers})
+
+    print(f"points = {size}, k = {k}, cpus = {cpus}")
+    print(f"{'algorithm':>10} {'workers':>8} {'seconds':>9} {'speedup':>8} {'same':>5}")
+    for name, function in (("centroids", clustering_with_centroids), ("medoids", clustering_with_medoids)):
+        baseline, reference = None, None
+        for workers in worker_counts:
+            start_time = time.perf_counter()
+            clusters = function(points, k, workers=workers, seed=size)
+            elapsed = time.perf_counter() - start_time
+
+            baseline = baseline or elapsed
+            reference = reference or clusters
+            print(f"{name:>10} {workers:>8} {elapsed:>9.2f} {baseline / elapsed:>8.2f} {str(clusters == reference):>5}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+    Benchmark of nearest neighbour queries: grid index versus avltree.find_closest.
+
+    For every size, generates clustered points, builds both structures and reports the
+    average cost per query point in microseconds.
+
+    Usage:
+        python benchmarks/bench_spatial_index.py [size ...]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from avltree import insert, find_closest, AVLNode
+from spatial_index import build_grid
+from util import generate_points
+
+queries_amount = 2_000
+
+
+def per_query(function, queries):
+    start_time = time.perf_counter()
+    function(queries)
+    return (time.perf_counter() - start_time) / len(queries) * 1e6
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+
+    print(f"{'points':>9} {'avl nn':>9} {'grid nn':>9} {'grid batch':>11} {'grid 10nn':>10} {'grid radius':>12}  (us/query)")
+    for size in sizes:
+        random.seed(size)
+        points = generate_points(20, size, (-5000, 5000), (-5000, 5000), (-100, 100), (-100, 100), seed=size)
+        points = [tuple(point) for point in points.tolist()]
+        queries = random.sample(points, queries_amount)
+
+        sys.setrecursionlimit(10_000)
+        root = None
+        for point in points:
+            root = insert(root, *point)
+        grid = build_grid(points)
+
+        avl = per_query(lambda q: [find_closest(root, AVLNode(*point)) for point in q], queries)
+        nearest = per_query(lambda q: [grid.nearest(point, exclude_self=True) for point in q], queries)
+        batch = per_query(grid.nearest_batch, queries)
+        k_nearest = per_query(lambda q: [grid.k_nearest(point, 10) for point in q], queries)
+        radius = per_query(lambda q: [grid.within_radius(point, 20) for point in q], queries)
+
+        print(f"{size:>9} {avl:>9.1f} {nearest:>9.1f} {batch:>11.1f} {k_nearest:>10.1f} {radius:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
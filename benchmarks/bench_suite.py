@@ -0,0 +1,179 @@
+"""
+    Scaling benchmark suite of both clustering algorithms with machine-readable results.
+
+    Runs clustering_with_centroids and clustering_with_medoids on generated points for every
+    combination of point count, k, cluster spread, chunk size and chunk partition. Every configuration is run
+    with warmups and repeats, followed by one traced and instrumented run for the peak memory
+    and the operation counts, and checked with the max_distance_allowed quality check of main.py.
+    The results are written as JSON, and can be compared against the JSON of an earlier run to
+    catch regressions.
+
+    Usage:
+        python benchmarks/bench_suite.py [--points 5000 20000] [--k 20 40] [--spread 50 100]
+                                         [--chunk-size 0] [--partition position spatial]
+                                         [--repeats 3] [--output results.json]
+                                         [--compare baseline.json]
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from evaluation import evaluate
+from model import methods as algorithms
+from util import generate_points
+
+config_keys = ("algorithm", "points", "k", "spread", "chunk_size", "partition", "workers", "input")
+config_defaults = {"partition": "position"}  # Values of keys missing from the results of older runs
+
+
+def configuration_of(result):
+    """Returns the tuple of configuration values of a result."""
+    return tuple(result.get(key, config_defaults.get(key)) for key in config_keys)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark both clustering algorithms over a grid of configurations.")
+    parser.add_argument("--algorithms", nargs="+", choices=list(algorithms), default=list(algorithms))
+    parser.add_argument("--points", nargs="+", type=int, default=[5_000, 20_000], help="point counts")
+    parser.add_argument("--k", nargs="+", type=int, default=[20, 40], help="numbers of clusters")
+    parser.add_argument("--blobs", type=int, default=20, help="initial points the generated points grow around")
+    parser.add_argument("--spread", nargs="+", type=int, default=[50, 100], help="maximum offset of a generated point from its source point")
+    parser.add_argument("--chunk-size", nargs="+", type=int, default=[0], help="points per chunk, 0 for the default of points / k")
+    parser.add_argument("--partition", nargs="+", choices=("position", "spatial"), default=["position"], help="chunk partitions of both pipelines")
+    parser.add_argument("--workers", type=int, default=None, help="workers of the chunk stage, sequential by default; the peak memory only covers the main process")
+    parser.add_argument("--input", choices=("list", "array"), default="list", help="pass points as tuples or as an array")
+    parser.add_argument("--warmups", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the generated points and of the clustering")
+    parser.add_argument("--max-distance-allowed", type=float, default=500)
+    parser.add_argument("--output", help="JSON file to write, stdout by default")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare the median times against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slowdown reported as a regression")
+    return parser.parse_args()
+
+
+def run_configuration(arguments, algorithm, size, k, spread, chunk_size, partition):
+    points = generate_points(arguments.blobs, size, (-5000, 5000), (-5000, 5000), (-spread, spread), (-spread, spread), seed=arguments.seed)
+    if arguments.input == "list":
+        points = [tuple(point) for point in points.tolist()]
+
+    function = algorithms[algorithm]
+
+    def run(return_stats=False):
+        random.seed(arguments.seed)
+        return function(points, k, workers=arguments.workers, seed=arguments.seed, chunk_size=chunk_size or None,
+                        partition=partition, return_labels=True, return_stats=return_stats)
+
+    for _ in range(arguments.warmups):
+        run()
+
+    seconds = []
+    for _ in range(arguments.repeats):
+        start_time = time.perf_counter()
+        clusters, labels, centers = run()
+        seconds.append(time.perf_counter() - start_time)
+
+    # Tracing slows the run down, so the peak memory and the operation counts are taken in a separate run
+    tracemalloc.start()
+    *_, stats = run(return_stats=True)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    evaluation = evaluate(points, labels, centers, arguments.max_distance_allowed)
+    return {
+        "algorithm": algorithm,
+        "points": size,
+        "k": k,
+        "spread": spread,
+        "chunk_size": chunk_size or None,
+        "partition": partition,
+        "workers": arguments.workers,
+        "input": arguments.input,
+        "seconds": seconds,
+        "median_seconds": statistics.median(seconds),
+        "min_seconds": min(seconds),
+        "peak_memory_bytes": peak_memory,
+        "operations": stats.counters,
+        "clusters": len(clusters),
+        "max_mean_distance": evaluation["max_mean_distance"],
+        "inertia": evaluation["inertia"],
+        "quality_passed": evaluation["success"],
+    }
+
+
+def compare(results, baseline_path, tolerance):
+    """Prints the median time ratio of every configuration also found in the baseline and returns the regressions."""
+    with open(baseline_path) as file:
+        baseline = {configuration_of(result): result for result in json.load(file)["results"]}
+
+    regressions = []
+    print(f"{'configuration':<60} {'baseline':>9} {'current':>9} {'ratio':>6}", file=sys.stderr)
+    for result in results:
+        configuration = configuration_of(result)
+        if configuration not in baseline:
+            continue
+        before = baseline[configuration]
+        ratio = result["median_seconds"] / before["median_seconds"]
+        regressed = ratio > 1 + tolerance or (before["quality_passed"] and not result["quality_passed"])
+        if regressed:
+            regressions.append(result)
+        label = " ".join(f"{key}={value}" for key, value in zip(config_keys, configuration))
+        print(f"{label:<60} {before['median_seconds']:>9.3f} {result['median_seconds']:>9.3f} {ratio:>6.2f}"
+              f"{'  REGRESSION' if regressed else ''}", file=sys.stderr)
+    return regressions
+
+
+def main():
+    arguments = parse_arguments()
+
+    results = []
+    for algorithm, size, k, spread, chunk_size, partition in itertools.product(
+            arguments.algorithms, arguments.points, arguments.k, arguments.spread, arguments.chunk_size, arguments.partition):
+        result = run_configuration(arguments, algorithm, size, k, spread, chunk_size, partition)
+        results.append(result)
+        print(f"{algorithm:>10} points={size} k={k} spread={spread} chunk_size={chunk_size or 'default'} "
+              f"partition={partition}: "
+              f"{result['median_seconds']:.3f} s, {result['peak_memory_bytes'] / 2 ** 20:.1f} MB, "
+              f"{'success' if result['quality_passed'] else 'fail'}", file=sys.stderr)
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "settings": {
+            "warmups": arguments.warmups,
+            "repeats": arguments.repeats,
+            "seed": arguments.seed,
+            "max_distance_allowed": arguments.max_distance_allowed,
+        },
+        "results": results,
+    }
+
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if arguments.compare and compare(results, arguments.compare, arguments.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,26 @@
+import heapq    # Import heapq for the priority queue of candidate closest pairs
+
+import numpy as np  # Import numpy for array input
+
+import agglomeration    # Import the vectorized centroid linkage of d-dimensional points
+import instrumentation
 from avltree import *   # Import all functions from AVL Tree module
-from util import *      # Import utility functions (e.g., compute_distance, compute_centroid)
+from parallel import chunk_rng, chunk_seeds, pack_points, run_chunks, unpack_points
+from spatial_index import build_grid, chunk_representatives, spatial_chunks   # Import the grid index and the spatial partition
+from util import *      # Import utility functions (e.g., squared_distance, compute_centroid)
 
 
-def clustering(root, k):
+def clustering(root, k, rng=random, centroid_of=compute_centroid):
     sample_size = k >> 1
     while count_elements(root) > k:
-        nodes = tree_to_list(root)
-        nodes = random.sample(nodes, sample_size)
-        nodes.sort(key=lambda x: compute_distance(x.point, find_closest(root, x).point))
+        nodes = sample_nodes(root, sample_size, rng)
+        nodes.sort(key=lambda x: squared_distance(x.point, find_closest(root, x).point))
 
         node_a = nodes[0]
         node_b = find_closest(root, node_a)
 
         cluster_points = node_a.points + node_b.points
-        centroid = compute_centroid(cluster_points)
+        centroid = centroid_of(cluster_points)
 
         root = remove_node(root, node_a)
         root = remove_node(root, node_b)
@@ -26,36 +33,263 @@ def clustering(root, k):
     return clusters
 
 
-def clustering_with_centroids(data, k):
-    data = list(data)
-    clusters = []
+def clustering_heap(root, k, rng=None, centroid_of=compute_centroid, linkage=None, weight_of=len):
+    """
+        Agglomerative centroid clustering driven by a priority queue of closest pairs.
+
+        Every cluster remembers its nearest neighbour, and the pair is kept in a heap keyed
+        by distance. A merge only recomputes the neighbours of the clusters that pointed to
+        one of the merged clusters, so reducing n clusters to k costs about O(n log n)
+        nearest-neighbour queries on a grid index instead of a full scan per merge.
+
+        Parameters:
+            root: Root of an AVL tree whose nodes carry the cluster points.
+            k: Number of clusters to stop at.
+            rng: Unused, the engine is deterministic; accepted for the merge engine signature.
+            centroid_of: Function computing the centroid of a cluster from its points.
+            linkage: Optional list that receives one (cluster a, cluster b, distance, size) row per merge.
+              The initial clusters are numbered 0..n-1 in tree order and the cluster formed by the i-th
+              merge is numbered n + i, as in a SciPy linkage matrix; size is weight_of of its points.
+              A centroid that lands on an existing cluster is recorded as a second merge at distance 0.
+            weight_of: Function computing the size of a cluster from its points, for the linkage rows.
+
+        Returns:
+            A dictionary mapping each centroid to the list of its cluster points.
+        """
+    clusters = {node.point: node.points for node in tree_to_list(root) or []}
+    ids = {point: i for i, point in enumerate(clusters)}     # cluster -> number in the linkage
+    leaves = len(clusters)
+    grid = build_grid(clusters.keys())
+    grid_size = len(clusters)
+    nearest = {}        # cluster -> (closest cluster, distance)
+    pointed_by = {}     # cluster -> set of clusters whose closest cluster it is
+    heap = []
+
+    def update_nearest(point):
+        closest, distance = grid.nearest(point, exclude_self=True)
+        if closest is None:
+            return
+        nearest[point] = (closest, distance)
+        pointed_by.setdefault(closest, set()).add(point)
+        heapq.heappush(heap, (distance, point, closest))
+
+    def detach(point):
+        # Forget the cluster and return the clusters whose closest cluster it was
+        if point in nearest:
+            pointed_by.get(nearest.pop(point)[0], set()).discard(point)
+        return pointed_by.pop(point, set())
+
+    for point in clusters:
+        update_nearest(point)
+
+    while len(clusters) > k and heap:
+        # Coarsen the grid as clusters merge so that cells do not run empty
+        if len(clusters) * 4 < grid_size:
+            grid = build_grid(clusters.keys())
+            grid_size = len(clusters)
+
+        distance, point_a, point_b = heapq.heappop(heap)
+
+        # Skip entries that were superseded by a later merge
+        if nearest.get(point_a) != (point_b, distance):
+            continue
+
+        cluster_points = clusters.pop(point_a) + clusters.pop(point_b)
+        centroid = centroid_of(cluster_points)
+        if linkage is not None:
+            linkage.append((ids.pop(point_a), ids.pop(point_b), distance, weight_of(cluster_points)))
+
+        grid.remove(point_a)
+        grid.remove(point_b)
+        affected = detach(point_a) | detach(point_b)
+
+        # A centroid landing on an existing cluster absorbs it, the index keys on the point
+        if centroid in clusters:
+            cluster_points += clusters.pop(centroid)
+            grid.remove(centroid)
+            affected |= detach(centroid)
+            if linkage is not None:
+                linkage.append((leaves + len(linkage) - 1, ids.pop(centroid), 0.0, weight_of(cluster_points)))
+
+        clusters[centroid] = cluster_points
+        if linkage is not None:
+            ids[centroid] = leaves + len(linkage) - 1
+        grid.insert(*centroid)
+
+        # Only the clusters that pointed at a merged cluster need a new closest cluster
+        for point in affected:
+            if point in clusters and point != centroid:
+                detach_from = nearest.pop(point, None)
+                if detach_from is not None:
+                    pointed_by.get(detach_from[0], set()).discard(point)
+                update_nearest(point)
+        update_nearest(centroid)
+
+    return clusters
+
+
+merge_engines = {
+    "heap": clustering_heap,
+    "sample": clustering,
+}
+
+partitions = ("position", "spatial")
+
 
-    chunk_size = len(data) // k
+def cluster_chunk(task):
+    """
+        Reduces one chunk to k clusters, run in a worker process.
 
-    for i in range(0, len(data), chunk_size):
-        chunk = data[i:i + chunk_size]
-        root = None
-        for point in chunk:
-            root = insert(root, *point, [point])
-        clusters.append(clustering(root, k))
+        Parameters:
+            task: Tuple (packed chunk points, k, merge engine name, chunk seed).
 
-    root = None
-    for cluster in clusters:
-        for centroid, points in cluster.items():
-            root = insert(root, *centroid, points)
+        Returns:
+            A list of (centroid, number of points, sum of x, sum of y) summaries of the clusters.
+        """
+    chunk, k, merge, seed = task
+    chunk = unpack_points(chunk)
+    root = build_tree(chunk, [[point] for point in chunk])
+    clusters = merge_engines[merge](root, k, chunk_rng(seed))
 
-    clusters = {node: [] for node in clustering(root, k)}
+    # Send back summaries instead of the points, the global merge only needs the centroids and weights
+    return [(centroid, len(points), sum(point[0] for point in points), sum(point[1] for point in points))
+            for centroid, points in clusters.items()]
 
-    root = None
-    for cluster in clusters.keys():
-        root = insert(root, *cluster)
 
-    for point in data:
-        closest = find_closest(root, AVLNode(*point))
-        clusters[closest.point].append(point)
+def split_chunks(data, k, chunk_size, partition, oversample):
+    """
+        Splits the data into chunks and chooses the number of clusters of every chunk.
+
+        Parameters:
+            data: List of points (x, y), or an (n, d) array.
+            k: Number of clusters.
+            Further parameters as in clustering_with_centroids.
+
+        Returns:
+            The list of chunks, each a list or an array of points, and the list of their numbers of clusters.
+        """
+    if partition not in partitions:
+        raise ValueError(f"Unknown partition {partition!r}, expected one of {', '.join(partitions)}")
+
+    if partition == "position":
+        # Array chunks are views, only the worker turns its own chunk into tuples
+        chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+        return chunks, [k] * len(chunks)
+
+    coordinates = data if isinstance(data, np.ndarray) else as_point_array(data)
+    rows = spatial_chunks(coordinates, chunk_size)
+    reps = chunk_representatives(coordinates, rows, k, oversample)
+    if isinstance(data, np.ndarray):
+        return [data[np.sort(chunk_rows)] for chunk_rows in rows], reps
+    return [[data[row] for row in chunk_rows.tolist()] for chunk_rows in rows], reps
+
+
+def chunk_summaries(data, k, merge="heap", workers=None, executor="process", seed=None, chunk_size=None,
+                    partition="position", oversample=8.0):
+    """
+        Reduces every chunk of the data to k clusters, the first level of clustering_with_centroids.
+
+        Parameters:
+            data: List of points (x, y), or an (n, d) array.
+            k: Number of clusters per chunk; spatial chunks get an adaptive number of at most k clusters.
+            Further parameters as in clustering_with_centroids.
+
+        Returns:
+            A dictionary mapping each chunk centroid to the list of its (count, sum of x, sum of y) summaries;
+            d-dimensional summaries hold one sum per coordinate and are merged by agglomeration.merge_summaries.
+        """
+    if dimensions_of(data) != 2:
+        # The AVL tree of the merge engines holds points (x, y), other dimensions use the array linkage
+        chunk_size = min(chunk_size or len(data) // k, agglomeration.chunk_limit)
+        chunks, reps = split_chunks(data, k, chunk_size, partition, oversample)
+        function, tasks = agglomeration.cluster_chunk, list(zip(chunks, reps))
+    else:
+        chunk_size = chunk_size or len(data) // k
+        chunks, reps = split_chunks(data, k, chunk_size, partition, oversample)
+        seeds = chunk_seeds(seed, len(chunks))
+        function = cluster_chunk
+        tasks = [(pack_points(chunk), chunk_k, merge, chunk_seed) for chunk, chunk_k, chunk_seed in zip(chunks, reps, seeds)]
+
+    # Chunk clusters sharing a centroid are combined, the tree keys on the centroid
+    summaries = {}
+    for clusters in run_chunks(function, tasks, workers, executor):
+        for centroid, count, *sums in clusters:
+            summaries.setdefault(centroid, []).append((count, *sums))
+    return summaries
+
+
+def clustering_with_centroids(data, k, merge="heap", workers=None, executor="process", seed=None, chunk_size=None,
+                              partition="position", oversample=8.0, return_labels=False, return_stats=False):
+    """
+        Two-level centroid clustering: every chunk of the data is reduced to k clusters,
+        the chunk clusters are merged into k clusters and every point is assigned to the closest centroid.
+
+        Parameters:
+            data: Collection of points (x, y), or an (n, d) array such as a memory-mapped point file. Arrays
+              of other than two dimensions are clustered with the same centroid linkage as the "heap"
+              engine, vectorized over the coordinates (see agglomeration.agglomerate), in chunks of at
+              most agglomeration.chunk_limit points.
+            k: Number of clusters.
+            merge: Merge engine of points (x, y), "heap" or "sample".
+            workers: Number of workers clustering the chunks in parallel; None runs them sequentially.
+            executor: "process" or "thread" pool for the workers.
+            seed: Seed making the random choices of the merge engine reproducible, independent of workers.
+            chunk_size: Number of points per chunk; by default the data is split into k chunks.
+            partition: "position" cuts the data into chunks in input order and reduces each to k clusters;
+              "spatial" cuts it into spatially compact chunks (see spatial_index.spatial_chunks), which
+              share about oversample * k clusters in proportion to the area they cover.
+            oversample: Total number of chunk clusters of the spatial partition as a multiple of k.
+            return_labels: Also return the label of every point, in the order of data, and the centroids
+              as a (k, d) array whose row j is the centroid of label j.
+            return_stats: Also return the instrumentation.Stats of the run, with the operation counters
+              and the "chunks", "merge" and "assignment" phase timers.
+
+        Returns:
+            A dictionary mapping each centroid to the list of its points, or to an array of its points
+            for array input; with return_labels a (clusters, labels, centers) tuple. With return_stats
+            the stats are appended as the last element of the result.
+        """
+    if return_stats:
+        with instrumentation.recording() as stats:
+            result = clustering_with_centroids(data, k, merge, workers, executor, seed, chunk_size, partition, oversample,
+                                               return_labels)
+        return (*result, stats) if return_labels else (result, stats)
+
+    is_array = isinstance(data, np.ndarray)
+    data = data if is_array else list(data)
+
+    with instrumentation.phase("chunks"):
+        summaries = chunk_summaries(data, k, merge, workers, executor, seed, chunk_size, partition, oversample)
+
+    with instrumentation.phase("merge"):
+        if dimensions_of(data) != 2:
+            counts = [sum(summary[0] for summary in cluster) for cluster in summaries.values()]
+            merged, _ = agglomeration.merge_summaries(np.array(list(summaries)), counts, k)
+            centroids = [tuple(centroid) for centroid in merged.tolist()]
+        else:
+            root = build_tree(list(summaries.keys()), list(summaries.values()))
+            centroids = list(merge_engines[merge](root, k, chunk_rng(seed), centroid_of=compute_summary_centroid))
+
+    with instrumentation.phase("assignment"):
+        if is_array:
+            labels = nearest_center_labels(data, centroids)
+            clusters = group_by_label(data, labels, centroids)
+            return (clusters, *compact_labels(labels, centroids)) if return_labels else clusters
+
+        clusters = {centroid: [] for centroid in centroids}
+
+        grid = build_grid(clusters.keys())
+        closest_centroids = grid.nearest_batch(data)
+        for point, closest in zip(data, closest_centroids):
+            clusters[closest].append(point)
 
     for cluster in list(clusters.keys()):
         if len(clusters[cluster]) == 0:
             del clusters[cluster]
 
-    return clusters
\ No newline at end of file
+    if return_labels:
+        index = {centroid: label for label, centroid in enumerate(clusters)}
+        labels = np.fromiter((index[closest] for closest in closest_centroids), dtype=np.intp, count=len(data))
+        return clusters, labels, np.asarray(list(clusters), dtype=float).reshape(-1, 2)
+
+    return clusters
@@ -1,8 +1,18 @@
+import multiprocessing  # Import multiprocessing for the best costs shared between restarts
 import random   # Import random module for selecting random medoids
 
-from avltree import insert, AVLNode, find_closest, tree_to_list
-from clustering_with_centroids import clustering_with_centroids
-from util import compute_distance   # Import compute_distance function to calculate Euclidean distance
+import numpy as np  # Import numpy for array input
+
+import instrumentation
+from agglomeration import agglomerate
+from assignment import HamerlyAssigner
+from avltree import build_tree, tree_to_list
+from clustering_with_centroids import clustering_heap, clustering_with_centroids, split_chunks
+from fastpam import clustering_fastpam
+from kdtree import KDTree
+from parallel import chunk_rng, chunk_seeds, pack_points, run_chunks, unpack_points
+from spatial_index import build_grid   # Import the grid index used for nearest neighbour queries
+from util import PointStore, as_point_array, closest_rows, cluster_costs, compute_summary_centroid, dimensions_of, distance_sums, group_by_label, nearest_center_labels, point_distances
 
 
 def assign_points_to_medoids(points, medoids):
@@ -18,15 +28,12 @@ def assign_points_to_medoids(points, medoids):
         """
     clusters = {medoid: [] for medoid in medoids}   # Initialize clusters as an empty list for each medoid
 
-    root = None
-    for medoid in medoids:
-        root = insert(root, *medoid)
+    grid = build_grid(medoids)
 
-    for point in points:
-        # Find the closest medoid by computing the distance between the point and each medoid
-        if point not in medoids:
-            closest_medoid = find_closest(root, AVLNode(*point)).point
-            clusters[closest_medoid].append(point)  # Assign the point to the closest medoid's cluster
+    # Find the closest medoid of every point that is not a medoid itself in one batched query
+    points = [point for point in points if point not in clusters]
+    for point, closest_medoid in zip(points, grid.nearest_batch(points)):
+        clusters[closest_medoid].append(point)  # Assign the point to the closest medoid's cluster
     return clusters
 
 
@@ -44,85 +51,290 @@ def calculate_total_cost(clusters):
     total_cost = 0
     # Iterate through each medoid and its corresponding points
     for medoid, points in clusters.items():
-        # Calculate the sum of distances from each point to the medoid
-        total_cost += sum(compute_distance(point, medoid) for point in points)
+        # Calculate the sum of distances from each point to the medoid in one vectorized step
+        total_cost += float(point_distances(points, medoid).sum()) if len(points) else 0
     return total_cost
 
 
-def update_medoids(clusters):
+def update_medoid_rows(coordinates, labels, medoid_rows):
     """
-        Update medoids by finding the medoid that minimizes the total distance to all points in the cluster.
+        Moves every medoid to the member of its cluster with the smallest sum of distances to the other members,
+        the first one on ties.
+
+        As in assign_points_to_medoids, the medoids themselves are not members of their clusters.
 
         Parameters:
-        - clusters: A dictionary of clusters where keys are medoids and values are lists of points.
+            coordinates: (n, d) array of the points.
+            labels: Array with the medoid index of every point.
+            medoid_rows: Array with the row of every medoid.
 
         Returns:
-        - new_medoids: A list of updated medoids.
+            An array with the row of every updated medoid.
         """
-    new_medoids = []
-    for medoid, points in clusters.items():
-        # For each cluster, find the point that minimizes the sum of distances to other points in the cluster
-        # sorted_points = sorted(points, key=lambda x: sum(compute_distance(x, cluster_point) for cluster_point in points))
-        best_medoid = find_real_center(points) if len(points) > 0 else medoid
-        new_medoids.append(best_medoid) # Update the medoid with the best point
+    members = np.ones(len(coordinates), dtype=bool)
+    members[medoid_rows] = False
+    rows = np.flatnonzero(members)
+    rows = rows[np.argsort(labels[rows], kind="stable")]
+    bounds = np.searchsorted(labels[rows], np.arange(len(medoid_rows) + 1))
+
+    new_rows = medoid_rows.copy()
+    for j in range(len(medoid_rows)):
+        cluster = rows[bounds[j]:bounds[j + 1]]
+        if len(cluster):
+            instrumentation.count("find_real_center")
+            new_rows[j] = cluster[distance_sums(coordinates[cluster]).argmin()]
+    return new_rows
+
+
+def clustering(points, k, max_iterations, medoids = None, rng = random, should_stop = None):
+    medoids = rng.sample(points, k) if medoids is None else rng.sample(medoids, k)
+
+    # The iterations work on the rows of an array-backed store; the assigner keeps distance bounds
+    # between iterations, and the assignment of the new medoids becomes the assignment of the next
+    # iteration instead of being recomputed
+    store = PointStore(points)
+    assigner = HamerlyAssigner(store.array)
+    medoid_rows = store.rows(medoids)
+    labels = assigner.assign(store.array[medoid_rows])
+    old_cost = float(cluster_costs(store.array, labels, store.array[medoid_rows]).sum())
 
-    return new_medoids
+    for _ in range(max_iterations):
+        new_rows = update_medoid_rows(store.array, labels, medoid_rows)
+        labels = assigner.assign(store.array[new_rows])
+        new_cost = float(cluster_costs(store.array, labels, store.array[new_rows]).sum())
 
+        if new_cost >= old_cost:
+            break  # Stop if no improvement in cost
+        improvement = old_cost - new_cost
+        medoid_rows, old_cost = new_rows, new_cost
 
-def find_real_center(points):
-    return min(points, key=lambda x: sum(compute_distance(x, point) for point in points))
+        if should_stop is not None and should_stop(new_cost, improvement):
+            break  # Stop a restart that is not going to beat the best one
 
+    instrumentation.count("hamerly_distance_evaluations", assigner.distance_evaluations)
+    return store.take(medoid_rows)
 
-def clustering(points, k, max_iterations, medoids = None):
-    medoids = random.sample(points, k) if medoids is None else random.sample(medoids, k)
 
-    for _ in range(max_iterations):
-        clusters = assign_points_to_medoids(points, medoids)
-        old_cost = calculate_total_cost(clusters)
+medoid_engines = {
+    "pam": clustering,
+    "fastpam": clustering_fastpam,
+}
 
-        new_medoids = update_medoids(clusters)
-        new_clusters = assign_points_to_medoids(points, new_medoids)
-        new_cost = calculate_total_cost(new_clusters)
 
-        if new_cost >= old_cost:
-            break  # Stop if no improvement in cost
-        medoids = new_medoids
+def cluster_chunk(task):
+    """
+        Finds k medoids of one chunk, run in a worker process.
 
-    return medoids
+        Parameters:
+            task: Tuple (packed chunk points, k, max_iterations, medoid engine name, chunk seed).
 
+        Returns:
+            The list of medoids of the chunk.
+        """
+    chunk, k, max_iterations, engine, seed = task
+    return medoid_engines[engine](unpack_points(chunk), k, max_iterations, rng=chunk_rng(seed))
 
-def clustering_with_medoids(points, k, max_iterations=100):
-    """Perform the k-medoids clustering algorithm."""
 
-    # points = sorted(points)
+best_costs = None   # Lowest total cost found so far per chunk, shared by the restarts of all workers
 
-    root = None
-    for point in points:
-        root = insert(root, *point)
 
-    points = [node.point for node in tree_to_list(root)]
+def share_best_costs(costs):
+    """Installs the shared best cost array in a worker, the pool initializer of the restart mode."""
+    global best_costs
+    best_costs = costs
 
-    chunk_size = len(points) // k
 
-    medoids = []
+def restart_chunk(task):
+    """
+        Runs one seeded restart of the medoid search on a chunk, run in a worker process.
+
+        The restart is cancelled once its cost, even after another improvement as large as its last one,
+        would remain more than cancel_margin above the best cost any restart of the chunk has reached.
+
+        Parameters:
+            task: Tuple (packed chunk points, k, max_iterations, medoid engine name, restart seed,
+                  chunk index, cancel margin or None).
+
+        Returns:
+            A (chunk index, total cost, medoids) tuple; the cost of a cancelled restart is infinite.
+        """
+    chunk, k, max_iterations, engine, seed, index, cancel_margin = task
+    points = unpack_points(chunk)
+    cancelled = False
+
+    def should_stop(cost, improvement):
+        nonlocal cancelled
+        cancelled = cost - improvement > best_costs[index] * (1 + cancel_margin)
+        return cancelled
+
+    medoids = medoid_engines[engine](points, k, max_iterations, rng=chunk_rng(seed),
+                                     should_stop=should_stop if cancel_margin is not None else None)
+    if cancelled:
+        instrumentation.count("cancelled_restarts")
+        return index, float("inf"), medoids
+
+    # The chunk array gives the cost in any dimension; medoids are at distance 0 of themselves
+    centers = as_point_array(medoids)
+    cost = float(cluster_costs(chunk, nearest_center_labels(chunk, centers), centers).sum())
+    with best_costs.get_lock():
+        best_costs[index] = min(best_costs[index], cost)
+    return index, cost, medoids
+
+
+def best_restarts(chunks, reps, max_iterations, workers, executor, seed, engine, restarts, cancel_margin):
+    """
+        Runs restarts seeded restarts of the medoid search on every chunk and keeps the best of each chunk.
+
+        Parameters:
+            chunks: List of chunks of points.
+            reps: Number of medoids of every chunk.
+            Further parameters as in clustering_with_medoids.
+
+        Returns:
+            The medoids of the lowest cost restart of every chunk, concatenated.
+        """
+    seeds = chunk_seeds(seed, len(chunks) * restarts)
+    packed = [pack_points(chunk) for chunk in chunks]
+    # Restart-major order, so that the first restart of every chunk starts before any second one
+    tasks = [(packed[index], reps[index], max_iterations, engine, seeds[restart * len(chunks) + index], index, cancel_margin)
+             for restart in range(restarts) for index in range(len(chunks))]
+
+    costs = multiprocessing.Array("d", [float("inf")] * len(chunks))
+    best = [(float("inf"), None)] * len(chunks)
+    for index, cost, medoids in run_chunks(restart_chunk, tasks, workers, executor, share_best_costs, (costs,)):
+        if best[index][1] is None or cost < best[index][0]:
+            best[index] = (cost, medoids)
+    return [medoid for _, medoids in best for medoid in medoids]
+
 
-    for i in range(0, len(points), chunk_size):
-        medoids.extend(clustering(points[i: i + chunk_size], k, max_iterations))
+def weighted_merge(points, medoids, k):
+    """
+        Merges the chunk medoids of a spatial partition into k medoids.
 
-    best_medoids = [centroid for centroid in clustering_with_centroids(medoids, k).keys()]
+        Spatial chunks get more medoids per point in sparse regions than in dense ones, so unlike the
+        equal-sized medoid sets of position chunks they cannot be merged as plain points: every medoid is
+        weighted by the number of points closest to it. Each merged centroid is then replaced by the point
+        closest to it, since the few adaptive chunk medoids are too coarse to snap to.
 
-    root = None
-    for medoid in medoids:
-        root = insert(root, *medoid)
+        Parameters:
+            points: Sorted, duplicate-free list or array of the points.
+            medoids: List of the medoids of all chunks.
+            k: Number of clusters.
 
-    clusters = {find_closest(root, AVLNode(*medoid)).point: [] for medoid in best_medoids}
+        Returns:
+            The list of the merged medoids.
+        """
+    coordinates = points if isinstance(points, np.ndarray) else as_point_array(points)
+    block_size = max(1, 1_000_000 // len(medoids))   # Bounds the points x medoids distance block
+    counts = np.bincount(nearest_center_labels(coordinates, medoids, block_size), minlength=len(medoids))
+    if dimensions_of(coordinates) != 2:
+        centroids, _ = agglomerate(medoids, counts, k)
+    else:
+        summaries = [[(count, count * x, count * y)] for (x, y), count in zip(medoids, counts.tolist())]
+        centroids = list(clustering_heap(build_tree(medoids, summaries), k, centroid_of=compute_summary_centroid))
+
+    rows = closest_rows(coordinates, centroids).tolist()
+    if isinstance(points, np.ndarray):
+        return [tuple(point) for point in points[rows].tolist()]
+    return [points[row] for row in rows]
+
+
+def clustering_with_medoids(points, k, max_iterations=100, workers=None, executor="process", seed=None, engine="pam",
+                            chunk_size=None, restarts=1, cancel_margin=0.1, partition="position", oversample=8.0,
+                            return_labels=False, return_stats=False):
+    """
+        Perform the k-medoids clustering algorithm.
 
-    root = None
-    for medoid in clusters.keys():
-        root = insert(root, *medoid)
+        Parameters:
+        - points: Collection of points (x, y), or an (n, d) array such as a memory-mapped point file. The
+          medoid search needs the sorted, duplicate-free points, so unlike clustering_with_centroids this
+          reads a mapped file completely into memory, once; only the labelling of the input with
+          return_labels reads it again, in blocks.
+        - k: Number of clusters.
+        - max_iterations: Maximum number of iterations per chunk.
+        - workers: Number of workers clustering the chunks in parallel; None runs them sequentially.
+        - executor: "process" or "thread" pool for the workers.
+        - seed: Seed making the medoid sampling reproducible, independent of workers.
+        - engine: Medoid search per chunk, "pam" (alternating reassignment) or "fastpam" (swap search).
+        - chunk_size: Number of points per chunk, at least k; by default the points are split into k chunks.
+        - restarts: Number of seeded restarts of the medoid search per chunk; the medoids of the restart with
+          the lowest total cost are kept. All restarts of all chunks run as separate tasks on the workers.
+        - cancel_margin: Restarts that cannot get within this relative margin of the best cost of their
+          chunk are cancelled early; None runs every restart to the end, which is reproducible with seed.
+        - partition: "position" cuts the sorted points into chunks of k medoids each; "spatial" cuts them into
+          spatially compact chunks that share about oversample * k medoids in proportion to the area they cover.
+        - oversample: Total number of chunk medoids of the spatial partition as a multiple of k.
+        - return_labels: Also return the label of every input point, in input order and including repeated
+          points, and the medoids as a (k, d) array whose row j is the medoid of label j.
+        - return_stats: Also return the instrumentation.Stats of the run, with the operation counters and the
+          "ordering", "chunks", "merge" and "assignment" phase timers.
 
-    for point in points:
-        closest_medoid = find_closest(root, AVLNode(*point)).point
-        clusters[closest_medoid].append(point)
+        Returns:
+        - clusters: A dictionary mapping each medoid to its corresponding points, or to an array of its points
+          for array input; with return_labels a (clusters, labels, centers) tuple. With return_stats the stats
+          are appended as the last element of the result.
+        """
+    if return_stats:
+        with instrumentation.recording() as stats:
+            result = clustering_with_medoids(points, k, max_iterations, workers, executor, seed, engine, chunk_size,
+                                             restarts, cancel_margin, partition, oversample, return_labels)
+        return (*result, stats) if return_labels else (result, stats)
+
+    is_array = isinstance(points, np.ndarray)
+    original = points if is_array else list(points)
+
+    # Sorted, duplicate-free order of the points, as an in-order traversal of their AVL tree yields
+    with instrumentation.phase("ordering"):
+        if is_array:
+            points = np.unique(points, axis=0)    # Loads a memory-mapped file, see the points parameter
+        else:
+            points = [node.point for node in tree_to_list(build_tree(original)) or []]
+
+    chunk_size = max(chunk_size or len(points) // k, k)
+
+    chunks, reps = split_chunks(points, k, chunk_size, partition, oversample)
+    if partition == "position" and len(chunks) > 1 and len(chunks[-1]) < k:
+        chunks[-2:] = [points[(len(chunks) - 2) * chunk_size:]]  # Every chunk needs at least k points for k medoids
+        reps.pop()
+    medoids = []
+    with instrumentation.phase("chunks"):
+        if restarts > 1:
+            medoids = best_restarts(chunks, reps, max_iterations, workers, executor, seed, engine, restarts, cancel_margin)
+        else:
+            seeds = chunk_seeds(seed, len(chunks))
+            tasks = [(pack_points(chunk), chunk_k, max_iterations, engine, chunk_seed)
+                     for chunk, chunk_k, chunk_seed in zip(chunks, reps, seeds)]
+            for chunk_medoids in run_chunks(cluster_chunk, tasks, workers, executor):
+                medoids.extend(chunk_medoids)
+
+    with instrumentation.phase("merge"):
+        if partition == "spatial":
+            clusters = {medoid: [] for medoid in weighted_merge(points, medoids, k)}
+        elif dimensions_of(points) != 2:
+            best_medoids = list(clustering_with_centroids(np.asarray(medoids), k, seed=seed).keys())
+            rows, _ = KDTree(medoids).query(best_medoids)
+            clusters = {medoids[row]: [] for row in rows.tolist()}
+        else:
+            best_medoids = [centroid for centroid in clustering_with_centroids(medoids, k, seed=seed).keys()]
+
+            grid = build_grid(medoids)
+
+            clusters = {medoid: [] for medoid in grid.nearest_batch(best_medoids)}
+
+    with instrumentation.phase("assignment"):
+        centers = as_point_array(list(clusters))
+        if is_array:
+            clusters = group_by_label(points, nearest_center_labels(points, centers), list(clusters))
+            # Every medoid is one of the points, so no cluster is empty and the labels need no renumbering
+            return (clusters, nearest_center_labels(original, centers), centers) if return_labels else clusters
+
+        grid = build_grid(clusters.keys())
+
+        for point, closest_medoid in zip(points, grid.nearest_batch(points)):
+            clusters[closest_medoid].append(point)
+
+    if return_labels:
+        label_of = {point: label for label, cluster_points in enumerate(clusters.values()) for point in cluster_points}
+        return clusters, np.fromiter((label_of[point] for point in original), dtype=np.intp, count=len(original)), centers
 
-    return clusters
\ No newline at end of file
+    return clusters
@@ -0,0 +1,360 @@
+import random
+from array import array   # Import array for the contiguous node buffers
+
+import instrumentation
+from avltree import AVLNode  # Nodes handed out by the API are detached AVLNode copies
+
+NIL = -1    # Index standing for a missing child
+
+
+class CompactAVLTree:
+    """
+        AVL Tree whose nodes live in a pool of contiguous buffers instead of separate objects.
+
+        A node is an index into the buffers holding its coordinates, children, height and subtree size.
+        Cluster points are kept in a parallel list and only stored for nodes that have them. Freed indices
+        are reused by later insertions. All operations are iterative, so deep trees never hit the
+        recursion limit.
+        """
+    __slots__ = ("xs", "ys", "left", "right", "height", "size", "points", "free", "root")
+
+    def __init__(self):
+        self.xs = array("d")        # x coordinates
+        self.ys = array("d")        # y coordinates
+        self.left = array("i")      # Index of the left child or NIL
+        self.right = array("i")     # Index of the right child or NIL
+        self.height = array("i")    # Height of the node in the tree for balancing
+        self.size = array("i")      # Number of nodes in the subtree rooted at the node
+        self.points = []            # Cluster points or None
+        self.free = []              # Indices of removed nodes available for reuse
+        self.root = NIL
+
+    def __len__(self):
+        return self.size[self.root] if self.root != NIL else 0
+
+    def new_node(self, x, y, points):
+        """Allocates a leaf node in the pool and returns its index."""
+        if self.free:
+            index = self.free.pop()
+            self.xs[index], self.ys[index] = x, y
+            self.left[index] = self.right[index] = NIL
+            self.height[index] = self.size[index] = 1
+            self.points[index] = points
+            return index
+
+        self.xs.append(x)
+        self.ys.append(y)
+        self.left.append(NIL)
+        self.right.append(NIL)
+        self.height.append(1)
+        self.size.append(1)
+        self.points.append(points)
+        return len(self.xs) - 1
+
+    def node(self, index):
+        """Returns a detached AVLNode copy of the node at the given index."""
+        node = AVLNode(self.xs[index], self.ys[index], self.points[index])
+        node.height, node.size = self.height[index], self.size[index]
+        return node
+
+    def update(self, index):
+        """Updates the height and the subtree size of a node based on its children."""
+        left, right = self.left[index], self.right[index]
+        left_height = self.height[left] if left != NIL else 0
+        right_height = self.height[right] if right != NIL else 0
+        self.height[index] = 1 + (left_height if left_height > right_height else right_height)
+        self.size[index] = 1 + (self.size[left] if left != NIL else 0) + (self.size[right] if right != NIL else 0)
+
+    def balance(self, index):
+        """Calculates the balance factor of a node."""
+        left, right = self.left[index], self.right[index]
+        return (self.height[left] if left != NIL else 0) - (self.height[right] if right != NIL else 0)
+
+    def rotate_right(self, index):
+        """Performs a right rotation on the given node and returns the new subtree root."""
+        if instrumentation.active is not None:
+            instrumentation.active.count("avl_rotations")
+        l = self.left[index]
+        self.left[index] = self.right[l]
+        self.right[l] = index
+        self.update(index)
+        self.update(l)
+        return l
+
+    def rotate_left(self, index):
+        """Performs a left rotation on the given node and returns the new subtree root."""
+        if instrumentation.active is not None:
+            instrumentation.active.count("avl_rotations")
+        r = self.right[index]
+        self.right[index] = self.left[r]
+        self.left[r] = index
+        self.update(index)
+        self.update(r)
+        return r
+
+    def rebalance(self, index):
+        """Updates a node and rotates it if necessary, returning the new subtree root."""
+        self.update(index)
+        balance = self.balance(index)
+
+        if balance > 1:
+            if self.balance(self.left[index]) < 0:
+                self.left[index] = self.rotate_left(self.left[index])
+            return self.rotate_right(index)
+
+        if balance < -1:
+            if self.balance(self.right[index]) > 0:
+                self.right[index] = self.rotate_right(self.right[index])
+            return self.rotate_left(index)
+
+        return index
+
+    def retrace(self, path, subtree, delta):
+        """
+            Rebalances the nodes on the path bottom-up after the child of the last node became subtree.
+
+            Once a node keeps its index and height, the nodes above it only change in size by delta,
+            so the remaining path is updated without rebalancing.
+            """
+        for depth in range(len(path) - 1, -1, -1):
+            parent, went_left = path[depth]
+            if went_left:
+                self.left[parent] = subtree
+            else:
+                self.right[parent] = subtree
+
+            height = self.height[parent]
+            subtree = self.rebalance(parent)
+            if subtree == parent and self.height[parent] == height:
+                for ancestor, _ in path[:depth]:
+                    self.size[ancestor] += delta
+                return
+        self.root = subtree
+
+    def insert(self, x, y, points = None):
+        """Inserts a point (x, y) as a new node, ignoring points that are already present."""
+        path = []   # (node, went left) pairs from the root down
+        index = self.root
+        while index != NIL:
+            nx, ny = self.xs[index], self.ys[index]
+            if x < nx or (x == nx and y < ny):
+                path.append((index, True))
+                index = self.left[index]
+            elif x > nx or y > ny:
+                path.append((index, False))
+                index = self.right[index]
+            else:
+                return
+
+        self.retrace(path, self.new_node(x, y, points), 1)
+
+    def remove(self, x, y):
+        """Removes the node holding the point (x, y), if present."""
+        path = []
+        index = self.root
+        while index != NIL:
+            nx, ny = self.xs[index], self.ys[index]
+            if x < nx or (x == nx and y < ny):
+                path.append((index, True))
+                index = self.left[index]
+            elif x > nx or y > ny:
+                path.append((index, False))
+                index = self.right[index]
+            else:
+                break
+        else:
+            return
+
+        if self.left[index] != NIL and self.right[index] != NIL:
+            # Node with two children: take over the successor and remove the successor instead
+            target = index
+            path.append((index, False))
+            index = self.right[index]
+            while self.left[index] != NIL:
+                path.append((index, True))
+                index = self.left[index]
+            self.xs[target], self.ys[target] = self.xs[index], self.ys[index]
+            self.points[target] = self.points[index]
+
+        # Node with one or no child
+        child = self.left[index] if self.left[index] != NIL else self.right[index]
+        self.points[index] = None
+        self.free.append(index)
+
+        if path:
+            self.retrace(path, child, -1)
+        else:
+            self.root = child
+
+    def find_closest(self, x, y):
+        """Returns the index of the closest node to (x, y), skipping a node equal to it, or NIL."""
+        best, best_squared = NIL, float("inf")
+        visits = 0
+        stack = [(self.root, 0.0)]  # (node, squared x-distance that must beat the best to explore it)
+
+        while stack:
+            index, bound = stack.pop()
+            if index == NIL or bound >= best_squared:
+                continue
+            visits += 1
+
+            nx, ny = self.xs[index], self.ys[index]
+            if nx != x or ny != y:
+                squared = (nx - x) ** 2 + (ny - y) ** 2
+                if squared < best_squared:
+                    best, best_squared = index, squared
+
+            if x < nx or (x == nx and y < ny):
+                near, far = self.left[index], self.right[index]
+            else:
+                near, far = self.right[index], self.left[index]
+
+            # The far side is pushed first so it is examined after the near side has tightened the best
+            stack.append((far, (x - nx) ** 2))
+            stack.append((near, 0.0))
+
+        instrumentation.count("find_closest_visits", visits)
+        return best
+
+    def in_order(self):
+        """Yields the node indices in sorted order."""
+        stack = []
+        index = self.root
+        while stack or index != NIL:
+            while index != NIL:
+                stack.append(index)
+                index = self.left[index]
+            index = stack.pop()
+            yield index
+            index = self.right[index]
+
+    def select(self, rank):
+        """Returns the index of the node at the given 0-based rank of the in-order traversal."""
+        if not 0 <= rank < len(self):
+            raise IndexError("rank out of range")
+
+        index = self.root
+        while True:
+            left = self.left[index]
+            left_size = self.size[left] if left != NIL else 0
+            if rank < left_size:
+                index = left
+            elif rank == left_size:
+                return index
+            else:
+                rank -= left_size + 1
+                index = self.right[index]
+
+
+def get_height(tree):
+    """Returns the height of the tree, or 0 if the tree is None or empty."""
+    return tree.height[tree.root] if tree is not None and tree.root != NIL else 0
+
+
+def count_elements(tree):
+    """Counts the total number of nodes in the tree in O(1)."""
+    return len(tree) if tree is not None else 0
+
+
+def insert(tree, x, y, points = None):
+    """Inserts a point (x, y) into the tree, creating the tree if it is None, and returns the tree."""
+    if tree is None:
+        tree = CompactAVLTree()
+    tree.insert(x, y, points)
+    return tree
+
+
+def remove_node(tree, node):
+    """Removes the node with the same point as the given node and returns the tree."""
+    if tree is not None and node is not None:
+        tree.remove(*node.point)
+    return tree
+
+
+def find_closest(tree, node, best = None):
+    """Finds the closest node to a given node in the tree, returning a detached AVLNode or best."""
+    if tree is None or node is None:
+        return best
+
+    index = tree.find_closest(*node.point)
+    return tree.node(index) if index != NIL else best
+
+
+def build_tree(points, payloads = None, presorted = False):
+    """
+        Builds a perfectly balanced tree from a whole collection of points at once.
+
+        The points are sorted once (skipped when presorted) and duplicates are dropped like insert does.
+        Nodes are allocated in sorted order and linked from an explicit stack of index ranges, so the
+        build is linear in the number of points and does not recurse.
+
+        Parameters:
+            points: Sequence of points (x, y).
+            payloads: Optional sequence of cluster points aligned with points.
+            presorted: Whether the points are already in ascending order.
+
+        Returns:
+            The tree, or None if there are no points.
+        """
+    items = list(zip(points, payloads)) if payloads is not None else [(point, None) for point in points]
+    if not presorted:
+        items.sort(key=lambda item: item[0])
+    items = [item for i, item in enumerate(items) if i == 0 or item[0] != items[i - 1][0]]
+    if not items:
+        return None
+
+    tree = CompactAVLTree()
+    for (x, y), points in items:
+        tree.new_node(x, y, points)
+
+    # (low, high, parent, is left child) ranges still to be linked
+    stack = [(0, len(items), NIL, False)]
+    while stack:
+        low, high, parent, is_left = stack.pop()
+        if low >= high:
+            continue
+        middle = (low + high) // 2
+        # A range split at the middle yields a tree of height bit_length(n)
+        tree.height[middle] = (high - low).bit_length()
+        tree.size[middle] = high - low
+        if parent == NIL:
+            tree.root = middle
+        elif is_left:
+            tree.left[parent] = middle
+        else:
+            tree.right[parent] = middle
+        stack.append((low, middle, middle, True))
+        stack.append((middle + 1, high, middle, False))
+
+    return tree
+
+
+def min_value_node(tree):
+    """Finds the node with the minimum point value in the tree."""
+    index = tree.root
+    while tree.left[index] != NIL:
+        index = tree.left[index]
+    return tree.node(index)
+
+
+def tree_to_list(tree, tree_list = None):
+    """Converts the tree to a sorted list of detached nodes using an iterative in-order traversal."""
+    if tree is None:
+        return tree_list
+
+    if tree_list is None:
+        tree_list = []
+    instrumentation.count("tree_to_list")
+
+    tree_list.extend(tree.node(index) for index in tree.in_order())
+    return tree_list
+
+
+def select(tree, rank):
+    """Returns the node at the given 0-based rank of the in-order traversal in O(log n)."""
+    return tree.node(tree.select(rank))
+
+
+def sample_nodes(tree, amount, rng = random):
+    """Returns amount distinct nodes chosen uniformly at random in O(amount log n)."""
+    return [select(tree, rank) for rank in rng.sample(range(count_elements(tree)), amount)]
@@ -0,0 +1,147 @@
+import numpy as np  # Import numpy for the linkage matrix and the vectorized cuts
+
+from avltree import build_tree, tree_to_list
+from clustering_with_centroids import chunk_summaries, clustering_heap
+from evaluation import evaluate
+from util import compact_labels, compute_summary_centroid, group_by_label, nearest_center_labels
+
+
+class Dendrogram:
+    """
+        Complete merge tree of the global merge stage of clustering_with_centroids.
+
+        The leaves are the chunk clusters, each described by its number of points and coordinate sums,
+        and every row of the linkage matrix records one merge as (cluster a, cluster b, distance, size) in
+        SciPy's numbering. Cutting the tree replays a prefix of the merges, which only costs O(leaves),
+        so a clustering for any k or distance threshold needs neither the chunk stage nor the merge stage.
+        """
+    def __init__(self, counts, sums, linkage):
+        """
+            Parameters:
+                counts: Number of points of every leaf.
+                sums: (leaves, 2) array with the coordinate sums of every leaf.
+                linkage: Sequence of (cluster a, cluster b, distance, size) merge rows.
+            """
+        self.counts = np.asarray(counts, dtype=float)
+        self.sums = np.asarray(sums, dtype=float).reshape(-1, 2)
+        self.linkage = np.asarray(linkage, dtype=float).reshape(-1, 4)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def leaf_labels(self, merges):
+        """Returns the cluster label of every leaf after the first merges rows of the linkage matrix."""
+        leaves = len(self.counts)
+        parent = np.arange(leaves + merges)
+        rows = self.linkage[:merges, :2].astype(np.int64)
+        parent[rows[:, 0]] = parent[rows[:, 1]] = leaves + np.arange(merges)
+
+        # Pointer jumping: every step halves the remaining depth of the tree
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+        return np.unique(parent[:leaves], return_inverse=True)[1].reshape(-1)
+
+    def centers(self, merges):
+        """Returns the (clusters, 2) array of centroids after the first merges rows of the linkage matrix."""
+        labels = self.leaf_labels(merges)
+        counts = np.bincount(labels, weights=self.counts)
+        sums = np.stack([np.bincount(labels, weights=self.sums[:, axis]) for axis in range(2)], axis=1)
+        return sums / counts[:, None]
+
+    def cut(self, k):
+        """Returns the centroids of the k clusters, or of all leaves if there are fewer."""
+        return self.centers(min(max(len(self.counts) - k, 0), len(self.linkage)))
+
+    def cut_distance(self, threshold):
+        """
+            Returns the centroids of the clusters formed by the merges up to the given distance.
+
+            Centroid linkage is not monotone, so the merges are replayed in order up to the first one
+            farther apart than threshold.
+            """
+        above = np.flatnonzero(self.linkage[:, 2] > threshold)
+        return self.centers(int(above[0]) if len(above) else len(self.linkage))
+
+    def cluster(self, data, k):
+        """
+            Assigns the points to the centroids of the cut at k, as clustering_with_centroids does.
+
+            Returns:
+                A (clusters, labels, centers) tuple as returned by clustering_with_centroids with return_labels.
+            """
+        centers = self.cut(k)
+        points = data if isinstance(data, np.ndarray) else list(data)
+        labels = nearest_center_labels(np.asarray(points, dtype=float).reshape(-1, 2), centers)
+        labels, centers = compact_labels(labels, centers)
+
+        keys = [tuple(center) for center in centers.tolist()]
+        if isinstance(data, np.ndarray):
+            return group_by_label(data, labels, keys), labels, centers
+
+        clusters = {key: [] for key in keys}
+        for point, label in zip(points, labels.tolist()):
+            clusters[keys[label]].append(point)
+        return clusters, labels, centers
+
+    def sweep(self, data, ks, max_distance_allowed=None):
+        """
+            Evaluates the cut at every k on the points.
+
+            Parameters:
+                data: Collection of points (x, y), or an (n, 2) array.
+                ks: Iterable of numbers of clusters.
+                max_distance_allowed: Optional limit of the mean distance of a cluster's points to its center.
+
+            Returns:
+                A list with a dictionary of k, the number of non-empty clusters, the inertia, the largest mean
+                distance to the center and, with max_distance_allowed, the success of the check per k.
+            """
+        points = np.asarray(data if isinstance(data, np.ndarray) else list(data), dtype=float).reshape(-1, 2)
+        results = []
+        for k in ks:
+            centers = self.cut(k)
+            labels, centers = compact_labels(nearest_center_labels(points, centers), centers)
+            evaluation = evaluate(points, labels, centers, max_distance_allowed)
+            result = {
+                "k": k,
+                "clusters": len(centers),
+                "inertia": evaluation["inertia"],
+                "max_mean_distance": evaluation["max_mean_distance"],
+            }
+            if max_distance_allowed is not None:
+                result["success"] = evaluation["success"]
+            results.append(result)
+        return results
+
+
+def build_dendrogram(data, max_k, merge="heap", workers=None, executor="process", seed=None, chunk_size=None,
+                     partition="position", oversample=8.0):
+    """
+        Runs the chunk stage of clustering_with_centroids once and merges the chunk clusters all the way
+        down to one cluster with the heap merge engine, recording every merge.
+
+        Parameters:
+            data: Collection of points (x, y), or an (n, 2) array such as a memory-mapped point file.
+            max_k: Largest number of clusters that will be cut; every chunk is reduced to max_k clusters.
+            merge: Merge engine of the chunk stage, "heap" or "sample".
+            Further parameters as in clustering_with_centroids.
+
+        Returns:
+            The Dendrogram of the global merge stage.
+        """
+    data = data if isinstance(data, np.ndarray) else list(data)
+    summaries = chunk_summaries(data, max_k, merge, workers, executor, seed, chunk_size, partition, oversample)
+
+    root = build_tree(list(summaries.keys()), list(summaries.values()))
+    leaves = [node.points for node in tree_to_list(root) or []]
+
+    linkage = []
+    clustering_heap(root, 1, centroid_of=compute_summary_centroid, linkage=linkage,
+                    weight_of=lambda cluster: sum(summary[0] for summary in cluster))
+
+    counts = [sum(summary[0] for summary in leaf) for leaf in leaves]
+    sums = [(sum(summary[1] for summary in leaf), sum(summary[2] for summary in leaf)) for leaf in leaves]
+    return Dendrogram(counts, sums, linkage)
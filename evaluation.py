@@ -0,0 +1,56 @@
+import numpy as np  # Import numpy for the vectorized cluster statistics
+
+from util import as_point_array
+
+
+def center_distances(points, labels, centers):
+    """
+        Computes the distance of every point to the center of its cluster.
+
+        Parameters:
+            points: (n, d) array or sequence of points.
+            labels: Array with the cluster index of every point.
+            centers: (k, d) array whose row j is the center of cluster j.
+
+        Returns:
+            An array with the distance of every point to its center.
+        """
+    points = as_point_array(points)
+    centers = as_point_array(centers)
+    return np.sqrt(((points - centers[labels]) ** 2).sum(axis=1))
+
+
+def evaluate(points, labels, centers, max_distance_allowed=None):
+    """
+        Summarizes the quality of a clustering.
+
+        Parameters:
+            points: (n, d) array or sequence of points.
+            labels: Array with the cluster index of every point.
+            centers: (k, d) array whose row j is the center of cluster j.
+            max_distance_allowed: Limit on the mean distance of a cluster's points to its center.
+
+        Returns:
+            A dictionary with the cluster sizes, the mean and maximum distance to the center per cluster,
+            the inertia (sum of squared distances), the largest mean distance and, if max_distance_allowed
+            is given, whether every cluster's mean distance is within it.
+        """
+    labels = np.asarray(labels)
+    distances = center_distances(points, labels, centers)
+    k = len(centers)
+
+    sizes = np.bincount(labels, minlength=k)
+    mean_distances = np.bincount(labels, weights=distances, minlength=k) / np.maximum(sizes, 1)
+    max_distances = np.zeros(k)
+    np.maximum.at(max_distances, labels, distances)
+
+    result = {
+        "sizes": sizes,
+        "mean_distances": mean_distances,
+        "max_distances": max_distances,
+        "inertia": float((distances ** 2).sum()),
+        "max_mean_distance": float(mean_distances.max()) if k else 0.0,
+    }
+    if max_distance_allowed is not None:
+        result["success"] = result["max_mean_distance"] <= max_distance_allowed
+    return result
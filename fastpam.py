@@ -0,0 +1,171 @@
+import random   # Import random module for selecting the initial medoids
+
+import numpy as np  # Import numpy for the vectorized swap evaluation
+
+import instrumentation
+from util import pairwise_distances
+
+block_elements = 4_000_000  # Upper bound on the entries of one points x candidates distance block
+cache_elements = 16_000_000 # Upper bound on the entries of the distance matrix kept between iterations
+
+
+def nearest_two(distances):
+    """
+        Finds the nearest and second nearest medoid of every point.
+
+        Parameters:
+            distances: (n, k) array of distances from the points to the medoids.
+
+        Returns:
+            Arrays with the index of the nearest medoid, its distance and the distance of the second nearest.
+        """
+    order = np.argsort(distances, axis=1)[:, :2]
+    rows = np.arange(len(distances))
+    nearest = order[:, 0]
+    if distances.shape[1] > 1:
+        second = distances[rows, order[:, 1]]
+    else:
+        # With a single medoid every point is at most twice the largest distance from any other point, so
+        # this finite stand-in never wins a comparison and keeps the swap arithmetic free of inf - inf
+        second = np.full(len(distances), 2 * distances.max(initial=0.0) + 1.0)
+    return nearest, distances[rows, nearest], second
+
+
+def candidate_blocks(coordinates, cache):
+    """
+        Yields (candidate rows, points x candidates distances) blocks covering all points.
+
+        Distances are kept in single precision, the swap evaluation is bandwidth bound. When the full
+        distance matrix fits into cache_elements it is computed once and kept in cache, since it does not
+        change between iterations.
+        """
+    n = len(coordinates)
+    block_size = max(1, block_elements // max(n, 1))
+
+    if n * n <= cache_elements:
+        if "distances" not in cache:
+            cache["distances"] = np.empty((n, n), dtype=np.float32)
+            for start in range(0, n, block_size):
+                cache["distances"][:, start:start + block_size] = pairwise_distances(coordinates, coordinates[start:start + block_size])
+        for start in range(0, n, block_size):
+            yield np.arange(start, min(start + block_size, n)), cache["distances"][:, start:start + block_size]
+        return
+
+    for start in range(0, n, block_size):
+        candidates = np.arange(start, min(start + block_size, n))
+        yield candidates, pairwise_distances(coordinates, coordinates[candidates]).astype(np.float32)
+
+
+def best_swaps(coordinates, medoid_rows, nearest, nearest_distance, second_distance, cache):
+    """
+        Evaluates every (medoid, non-medoid) swap with the FastPAM decomposition and returns the best swap per medoid.
+
+        The change of the total cost of a swap splits into the loss of removing the medoid, which only
+        depends on the cached nearest and second nearest distances, and the gain of adding the candidate,
+        which is shared by all medoids except for a correction on the medoid each point currently uses.
+        A candidate is therefore evaluated against all k medoids at once in O(n).
+
+        Parameters:
+            coordinates: (n, d) array of the points.
+            medoid_rows: List of the rows of the current medoids.
+            nearest: Index of the nearest medoid of every point.
+            nearest_distance: Distance to the nearest medoid of every point.
+            second_distance: Distance to the second nearest medoid of every point.
+            cache: Dictionary kept between calls for the distance matrix.
+
+        Returns:
+            A list of (change of the total cost, medoid index, candidate row) of the improving swaps, best first.
+        """
+    n, k = len(coordinates), len(medoid_rows)
+    removal_loss = np.bincount(nearest, weights=second_distance - nearest_distance, minlength=k)
+    membership = np.zeros((k, n), dtype=np.float32)
+    membership[nearest, np.arange(n)] = 1.0
+    nearest_distance = nearest_distance.astype(np.float32)
+    second_distance = second_distance.astype(np.float32)
+
+    best_change = np.zeros(k)
+    best_candidate = np.full(k, -1)
+    for candidates, distances in candidate_blocks(coordinates, cache):
+        # Points closer to the candidate than to their medoid gain regardless of which medoid is removed
+        gain = np.minimum(distances - nearest_distance[:, None], 0.0)
+        shared = gain.sum(axis=0, dtype=np.float64)
+        # Correction on the medoid the point currently uses: a point that moves to the candidate
+        # cancels its removal loss, any other point falls back to the candidate instead of its second medoid
+        correction = np.minimum(distances - second_distance[:, None], 0.0)
+        correction -= gain
+
+        change = removal_loss[:, None] + membership @ correction + shared[None, :]  # (k, candidates)
+        change[:, np.isin(candidates, medoid_rows)] = np.inf
+
+        block_best = np.argmin(change, axis=1)
+        block_change = change[np.arange(k), block_best]
+        improved = block_change < best_change
+        best_change[improved] = block_change[improved]
+        best_candidate[improved] = candidates[block_best[improved]]
+
+    return sorted((best_change[medoid], medoid, int(best_candidate[medoid]))
+                  for medoid in range(k) if best_candidate[medoid] >= 0)
+
+
+def clustering_fastpam(points, k, max_iterations, medoids = None, rng = random, should_stop = None):
+    """
+        Find k medoids of the points with a FastPAM swap search.
+
+        Every iteration caches the nearest and second nearest medoid distance of each point and evaluates
+        all swaps incrementally. As in FastPAM2, the best swap of every medoid is kept and the swaps are
+        applied one after another while each still lowers the exactly recomputed total cost, which needs
+        far fewer iterations than applying a single swap. The search stops when no swap lowers the cost.
+
+        Parameters:
+        - points: List of points.
+        - k: Number of medoids.
+        - max_iterations: Maximum number of swap iterations.
+        - medoids: Optional candidates to draw the initial medoids from instead of the points.
+        - rng: Random generator used to draw the initial medoids.
+        - should_stop: Optional callback (cost, improvement of the iteration) returning True to end the search early.
+
+        Returns:
+        - medoids: A list of k medoids, each one of the points.
+        """
+    coordinates = np.asarray(points, dtype=float)
+    initial = rng.sample(points, k) if medoids is None else rng.sample(medoids, k)
+
+    # Initial medoids that are not points are replaced by the closest point
+    rows = {point: row for row, point in enumerate(points)}
+    medoid_rows = []
+    for medoid in initial:
+        row = rows.get(medoid)
+        if row is None or row in medoid_rows:
+            distances = pairwise_distances([medoid], coordinates)[0]
+            distances[medoid_rows] = np.inf
+            row = int(np.argmin(distances))
+        medoid_rows.append(row)
+
+    cache = {}
+    for _ in range(max_iterations):
+        instrumentation.count("fastpam_iterations")
+        medoid_distances = pairwise_distances(coordinates, coordinates[medoid_rows])
+        swaps = best_swaps(coordinates, medoid_rows, *nearest_two(medoid_distances), cache)
+        if not swaps or swaps[0][0] > -1e-9:
+            break  # Stop if no swap improves the cost
+
+        # Apply the best swap of every medoid as long as it still lowers the cost after the previous swaps
+        cost = start_cost = medoid_distances.min(axis=1).sum()
+        applied = False
+        for _, medoid, candidate in swaps:
+            if candidate in medoid_rows:
+                continue
+            swapped = medoid_distances.copy()
+            swapped[:, medoid] = pairwise_distances(coordinates, coordinates[[candidate]])[:, 0]
+            swapped_cost = swapped.min(axis=1).sum()
+            if swapped_cost < cost - 1e-9:
+                medoid_rows[medoid], medoid_distances, cost = candidate, swapped, swapped_cost
+                applied = True
+                instrumentation.count("fastpam_swaps")
+
+        if not applied:
+            break  # The single precision estimate found no swap the exact cost confirms
+        if should_stop is not None and should_stop(cost, start_cost - cost):
+            break
+
+    return [points[row] for row in medoid_rows]
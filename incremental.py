@@ -0,0 +1,228 @@
+import numpy as np  # Import numpy for the vectorized reassignment
+
+from model import methods
+from util import distance_sums, nearest_center_labels, point_distances
+
+
+class IncrementalClustering:
+    """
+        Clustering state that absorbs batches of added and removed points without rerunning the pipeline.
+
+        Every cluster keeps its members, their count and coordinate sums, the sum of their distances to
+        the center and an upper bound on the largest such distance. A batch only touches the clusters that
+        gained or lost points: their centroids (or medoids) are updated, their members are reassigned to the
+        closest center, and in any other cluster only the members farther from their center than half the
+        distance to a moved center are checked, since all others provably keep their cluster. The full
+        pipeline runs again ("re-merge") only when the largest mean distance of a cluster's points to its
+        center drifts more than drift above its value after the last full run, or past max_distance_allowed.
+        """
+    def __init__(self, points, k, method="centroids", drift=0.25, max_distance_allowed=None, max_iterations=5,
+                 medoid_candidates=16, seed=None, **options):
+        """
+            Parameters:
+                points: Collection of points (x, y).
+                k: Number of clusters.
+                method: "centroids" or "medoids", the pipeline of the full runs.
+                drift: Allowed relative growth of the quality measure before a re-merge.
+                max_distance_allowed: Optional absolute limit of the quality measure before a re-merge.
+                max_iterations: Maximum number of local reassignment rounds per batch.
+                medoid_candidates: Members closest to the cluster mean tried as its new medoid.
+                seed: Seed of the full runs.
+                options: Further keyword arguments of the pipeline, e.g. workers.
+            """
+        if method not in methods:
+            raise ValueError(f"Unknown method {method!r}, expected one of {', '.join(methods)}")
+
+        self.k = k
+        self.method = method
+        self.drift = drift
+        self.max_distance_allowed = max_distance_allowed
+        self.max_iterations = max_iterations
+        self.medoid_candidates = medoid_candidates
+        self.seed = seed
+        self.options = options
+        self.remerges = 0   # Number of full runs after the initial one
+        self.fit(points)
+
+    def fit(self, points):
+        """Clusters the points from scratch with the full pipeline and resets the quality baseline."""
+        points = list(dict.fromkeys(tuple(point) for point in points))
+        _, labels, centers = methods[self.method](points, self.k, seed=self.seed, return_labels=True, **self.options)
+
+        self.centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+        self.members = [set() for _ in range(len(self.centers))]
+        self.labels = {}
+        for point, label in zip(points, labels.tolist()):
+            self.members[label].add(point)
+            self.labels[point] = label
+
+        self.counts = np.array([len(members) for members in self.members], dtype=float)
+        self.active = self.counts > 0   # Clusters with members; only their centers take points
+        self.sums = np.array([np.sum(list(members), axis=0) if members else (0.0, 0.0) for members in self.members],
+                             dtype=float).reshape(-1, 2)
+        self.distance_sums = np.zeros(len(self.centers))
+        self.radii = np.zeros(len(self.centers))
+        for label in range(len(self.centers)):
+            self.measure(label)
+        self.baseline = self.quality()
+
+    def __len__(self):
+        return len(self.labels)
+
+    def closest(self, points):
+        """Returns the label of the closest center of every point, among the centers of the active clusters."""
+        # With every cluster emptied the centers keep their last position and all of them take points again
+        labels = np.flatnonzero(self.active) if self.active.any() else np.arange(len(self.centers))
+        return labels[nearest_center_labels(np.asarray(points, dtype=float), self.centers[labels])]
+
+    def member_array(self, label):
+        """Returns the members of a cluster as an (m, 2) array."""
+        return np.asarray(list(self.members[label]), dtype=float).reshape(-1, 2)
+
+    def measure(self, label):
+        """Recomputes the distance sum and the largest distance of a cluster's members to its center."""
+        distances = point_distances(self.member_array(label), self.centers[label])
+        self.distance_sums[label] = distances.sum()
+        self.radii[label] = distances.max() if len(distances) else 0.0
+
+    def quality(self):
+        """Returns the largest mean distance of a cluster's points to its center, the max_distance_allowed measure."""
+        occupied = self.counts > 0
+        return float((self.distance_sums[occupied] / self.counts[occupied]).max()) if occupied.any() else 0.0
+
+    def clusters(self):
+        """Returns a dictionary mapping each center to the list of its points, as the pipelines do."""
+        return {tuple(self.centers[label].tolist()): list(members)
+                for label, members in enumerate(self.members) if members}
+
+    def move(self, label, point, sign):
+        """Adds (sign 1) or removes (sign -1) a point to or from a cluster's member set and summaries."""
+        if sign > 0:
+            self.members[label].add(point)
+            self.labels[point] = label
+        else:
+            self.members[label].discard(point)
+        self.counts[label] += sign
+        self.sums[label] += np.multiply(point, sign)
+
+    def update_center(self, label):
+        """Moves the center of a cluster to the mean of its members, or to its best medoid candidate."""
+        self.active[label] = self.counts[label] > 0
+        if not self.active[label]:
+            return  # An empty cluster keeps its center but never is the closest center
+
+        mean = self.sums[label] / self.counts[label]
+        if self.method == "centroids":
+            self.centers[label] = mean
+            return
+
+        # The new medoid is searched among the members closest to the mean and the current medoid
+        members = self.member_array(label)
+        if len(members) > self.medoid_candidates:
+            closest = np.argpartition(((members - mean) ** 2).sum(axis=1), self.medoid_candidates)[:self.medoid_candidates]
+            candidates = members[closest]
+            if tuple(self.centers[label].tolist()) in self.members[label]:
+                candidates = np.vstack([candidates, self.centers[label]])
+        else:
+            candidates = members
+        self.centers[label] = candidates[distance_sums(members, candidates).argmin()]
+
+    def boundary_points(self, moved):
+        """
+            Returns the points of unmoved clusters that may now be closer to one of the moved centers.
+
+            A point whose distance to its center is at most half the distance from its center to another
+            center cannot be closer to that other center.
+            """
+        candidates = []
+        for label in np.flatnonzero(self.active):
+            if label in moved:
+                continue
+            half_gaps = np.sqrt(((self.centers[list(moved)] - self.centers[label]) ** 2).sum(axis=1)) / 2
+            half_gap = half_gaps.min() if len(half_gaps) else np.inf
+            if self.radii[label] <= half_gap:
+                continue
+
+            members = list(self.members[label])
+            distances = point_distances(members, self.centers[label])
+            candidates.extend(member for member, distance in zip(members, distances.tolist()) if distance > half_gap)
+        return candidates
+
+    def reassign(self, touched):
+        """
+            Moves the touched centers and reassigns the points they may have gained or lost until no point changes.
+
+            Every moved center gets its radius measured right away, as boundary_points of the next round relies on it.
+            When max_iterations runs out, the clusters changed by the last round are still moved and measured.
+            """
+        for _ in range(self.max_iterations):
+            for label in touched:
+                self.update_center(label)
+                self.measure(label)
+
+            moved = {label for label in touched if self.active[label]}
+            candidates = [point for label in touched for point in self.members[label]] + self.boundary_points(moved)
+            if not candidates or not moved:
+                break
+
+            new_labels = self.closest(candidates)
+            changed = set()
+            for point, label in zip(candidates, new_labels.tolist()):
+                old_label = self.labels[point]
+                if label != old_label:
+                    self.move(old_label, point, -1)
+                    self.move(label, point, 1)
+                    changed.update((old_label, label))
+
+            if not changed:
+                break
+            touched = changed
+        else:
+            for label in touched:
+                self.update_center(label)
+                self.measure(label)
+
+    def update(self, added=(), removed=()):
+        """
+            Applies a batch of changes.
+
+            Parameters:
+                added: Points to add; points already present are ignored.
+                removed: Points to remove; points not present are ignored.
+
+            Returns:
+                True if the quality drifted past the threshold and the clustering was rerun from scratch.
+            """
+        touched = set()
+        for point in dict.fromkeys(tuple(point) for point in removed):
+            label = self.labels.pop(point, None)
+            if label is not None:
+                self.move(label, point, -1)
+                touched.add(label)
+
+        added = [point for point in dict.fromkeys(tuple(point) for point in added) if point not in self.labels]
+        if added:
+            labels = self.closest(added)
+            for point, label in zip(added, labels.tolist()):
+                self.move(label, point, 1)
+                touched.add(label)
+
+        if touched:
+            self.reassign(touched)
+
+        limit = self.baseline * (1 + self.drift)
+        if self.max_distance_allowed is not None:
+            limit = min(limit, self.max_distance_allowed)
+        if self.quality() > limit:
+            self.fit(list(self.labels))
+            self.remerges += 1
+            return True
+        return False
+
+    def add(self, points):
+        """Adds a batch of points, see update."""
+        return self.update(added=points)
+
+    def remove(self, points):
+        """Removes a batch of points, see update."""
+        return self.update(removed=points)
@@ -0,0 +1,87 @@
+import time     # Import time module for the phase timers
+from contextlib import contextmanager
+
+active = None   # Stats currently being recorded, None while instrumentation is disabled
+
+
+class Stats:
+    """
+        Operation counters and phase timers of one instrumented run.
+
+        Hot paths guard their bookkeeping with `if instrumentation.active is not None`, so a
+        disabled run only pays for one global lookup per operation. Phases nest: a phase entered
+        inside another one is recorded under "outer/inner".
+        """
+    def __init__(self):
+        self.counters = {}  # Operation name -> number of occurrences
+        self.phases = {}    # Phase name -> seconds spent in it
+        self.stack = []     # Names of the phases currently entered
+
+    def __repr__(self):
+        return f"Stats(counters={self.counters}, phases={self.phases})"
+
+    def __str__(self):
+        lines = [f"{name:<40} {seconds:>12.3f} s" for name, seconds in self.phases.items()]
+        lines += [f"{name:<40} {count:>12}" for name, count in sorted(self.counters.items())]
+        return "\n".join(lines)
+
+    def count(self, name, amount=1):
+        """Adds amount to the counter name."""
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_time(self, name, seconds):
+        """Adds seconds to the timer of the phase name."""
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def merge(self, other):
+        """Adds the counters and phase timers of other, e.g. the stats of a worker process."""
+        for name, count in other.counters.items():
+            self.count(name, count)
+        prefix = "/".join(self.stack)
+        for name, seconds in other.phases.items():
+            self.add_time(f"{prefix}/{name}" if prefix else name, seconds)
+
+    def as_dict(self):
+        """Returns the stats as a JSON serializable dictionary."""
+        return {"counters": dict(self.counters), "phases": dict(self.phases)}
+
+
+@contextmanager
+def recording():
+    """
+        Enables instrumentation for the duration of the block and yields the Stats it records into.
+
+        Stats recorded inside an already instrumented block are also added to the outer stats on exit.
+        """
+    global active
+    previous, active = active, Stats()
+    stats = active
+    try:
+        yield stats
+    finally:
+        active = previous
+        if previous is not None:
+            previous.merge(stats)
+
+
+@contextmanager
+def phase(name):
+    """Times the block as the phase name when instrumentation is enabled."""
+    stats = active
+    if stats is None:
+        yield
+        return
+
+    stats.stack.append(name)
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.add_time("/".join(stats.stack), time.perf_counter() - start_time)
+        stats.stack.pop()
+
+
+def count(name, amount=1):
+    """Adds amount to the counter name when instrumentation is enabled; for call sites outside hot loops."""
+    if active is not None:
+        active.count(name, amount)
@@ -0,0 +1,180 @@
+import math     # Import math module for the depth of the tree
+
+import numpy as np  # Import numpy for the array-backed nodes and the batched queries
+
+import instrumentation
+
+
+class KDTree:
+    """
+        Static k-d tree over d-dimensional points with exact, batched nearest neighbour queries.
+
+        The tree is a complete binary tree stored in heap order: node i has the children 2i + 1 and
+        2i + 2, and every node keeps the bounding box of its points. Each split halves the points of a
+        node at the median of its widest coordinate, so all leaves sit on the last level and hold at most
+        leaf_size points. The leaves are stored as one (leaves, leaf_size, d) array padded with infinite
+        coordinates, so a leaf is compared against a query in one vectorized step.
+
+        A batch of queries first descends to its own leaves for an initial bound and then walks the
+        tree level by level as (query, node) pairs, dropping every pair whose box is farther than the
+        bound of its query. All comparisons use squared distances; the square root is only taken for
+        the returned distances.
+        """
+    def __init__(self, points, leaf_size=16):
+        """
+            Parameters:
+                points: (n, d) array or sequence of points.
+                leaf_size: Largest number of points per leaf.
+            """
+        self.points = np.asarray(points, dtype=float)
+        if self.points.ndim != 2:
+            self.points = self.points.reshape(len(self.points), -1)
+        n, dimensions = self.points.shape
+        self.depth = max(0, math.ceil(math.log2(n / leaf_size))) if n else 0
+        self.leaves = 2 ** self.depth
+        nodes = 2 * self.leaves - 1
+
+        self.lower = np.full((nodes, dimensions), np.inf)
+        self.upper = np.full((nodes, dimensions), -np.inf)
+        self.split_axis = np.zeros(max(self.leaves - 1, 1), dtype=np.intp)
+        self.split_value = np.zeros(max(self.leaves - 1, 1))
+
+        # Every level splits the row ranges of the previous one, in heap order
+        ranges = [np.arange(n)]
+        for level in range(self.depth + 1):
+            first = 2 ** level - 1
+            for offset, rows in enumerate(ranges):
+                if len(rows):
+                    self.lower[first + offset] = self.points[rows].min(axis=0)
+                    self.upper[first + offset] = self.points[rows].max(axis=0)
+            if level == self.depth:
+                break
+
+            children = []
+            for offset, rows in enumerate(ranges):
+                node = first + offset
+                axis = int((self.upper[node] - self.lower[node]).argmax()) if len(rows) else 0
+                half = len(rows) // 2
+                order = np.argpartition(self.points[rows, axis], half) if len(rows) > 1 else np.arange(len(rows))
+                self.split_axis[node] = axis
+                self.split_value[node] = self.points[rows[order[half]], axis] if len(rows) else 0.0
+                children += [rows[order[:half]], rows[order[half:]]]
+            ranges = children
+
+        capacity = max(max((len(rows) for rows in ranges), default=0), 1)
+        self.leaf_points = np.full((self.leaves, capacity, dimensions), np.inf)
+        self.leaf_rows = np.full((self.leaves, capacity), -1, dtype=np.intp)
+        for leaf, rows in enumerate(ranges):
+            self.leaf_points[leaf, :len(rows)] = self.points[rows]
+            self.leaf_rows[leaf, :len(rows)] = rows
+
+    def __len__(self):
+        return len(self.points)
+
+    def leaf_candidates(self, queries, query_rows, leaves, exclude_rows, block_elements=4_000_000):
+        """
+            Finds the closest point of one leaf for every (query, leaf) pair.
+
+            Parameters:
+                queries: (m, d) array of all queries.
+                query_rows: Query index of every pair.
+                leaves: Leaf index of every pair.
+                exclude_rows: Optional array with a point row per query that must not be returned.
+                block_elements: Upper bound on the coordinates compared in one step.
+
+            Returns:
+                The squared distance and the point row of the closest point of every pair.
+            """
+        capacity, dimensions = self.leaf_points.shape[1:]
+        block_size = max(1, block_elements // (capacity * max(dimensions, 1)))
+        squared = np.empty(len(query_rows))
+        rows = np.empty(len(query_rows), dtype=np.intp)
+
+        if instrumentation.active is not None:
+            instrumentation.active.count("kdtree_distances", len(query_rows) * capacity)
+
+        for start in range(0, len(query_rows), block_size):
+            block_queries = query_rows[start:start + block_size]
+            block_leaves = leaves[start:start + block_size]
+            difference = self.leaf_points[block_leaves] - queries[block_queries, None, :]
+            distances = np.einsum("pcd,pcd->pc", difference, difference)
+            if exclude_rows is not None:
+                distances[self.leaf_rows[block_leaves] == exclude_rows[block_queries, None]] = np.inf
+
+            closest = distances.argmin(axis=1)
+            positions = np.arange(len(block_queries))
+            squared[start:start + block_size] = distances[positions, closest]
+            rows[start:start + block_size] = self.leaf_rows[block_leaves, closest]
+        return squared, rows
+
+    def query(self, points, exclude_rows=None, block_pairs=2_000_000):
+        """
+            Finds the closest point of the tree for every query point.
+
+            Parameters:
+                points: (m, d) array or sequence of query points.
+                exclude_rows: Optional array with a row of the tree per query that is skipped, e.g.
+                  np.arange(len(tree)) to find the closest other point of every point of the tree.
+                block_pairs: Upper bound on the (query, leaf) pairs of one block of queries, reached
+                  when no box can be pruned, as in high dimensions.
+
+            Returns:
+                An array with the row of the closest point of every query, -1 if there is none, and an
+                array with the distances.
+            """
+        queries = np.asarray(points, dtype=float).reshape(len(points), -1)
+        m = len(queries)
+        if instrumentation.active is not None:
+            instrumentation.active.count("kdtree_queries", m)
+
+        rows = np.full(m, -1, dtype=np.intp)
+        squared = np.full(m, np.inf)
+        if not len(self.points):
+            return rows, squared
+
+        block_size = max(1, block_pairs // self.leaves)
+        for start in range(0, m, block_size):
+            block = slice(start, start + block_size)
+            excluded = exclude_rows[block] if exclude_rows is not None else None
+            rows[block], squared[block] = self.query_block(queries[block], excluded)
+        return rows, np.sqrt(squared)
+
+    def query_block(self, queries, exclude_rows):
+        """Answers one block of queries of query, returning the rows and the squared distances."""
+        m = len(queries)
+
+        # Descend to the leaf of every query for an initial bound
+        nodes = np.zeros(m, dtype=np.intp)
+        positions = np.arange(m)
+        for _ in range(self.depth):
+            right = queries[positions, self.split_axis[nodes]] >= self.split_value[nodes]
+            nodes = 2 * nodes + 1 + right
+        own_leaves = nodes - (self.leaves - 1)
+        best_squared, best_rows = self.leaf_candidates(queries, positions, own_leaves, exclude_rows)
+
+        # Walk the tree as (query, node) pairs, keeping the pairs whose box may hold a closer point
+        query_rows, nodes = positions, np.zeros(m, dtype=np.intp)
+        for level in range(self.depth + 1):
+            gap = np.maximum(self.lower[nodes] - queries[query_rows], 0.0)
+            gap += np.maximum(queries[query_rows] - self.upper[nodes], 0.0)
+            keep = np.einsum("pd,pd->p", gap, gap) < best_squared[query_rows]
+            query_rows, nodes = query_rows[keep], nodes[keep]
+            if level < self.depth:
+                query_rows = np.repeat(query_rows, 2)
+                nodes = (2 * np.repeat(nodes, 2) + 1) + np.tile([0, 1], len(nodes))
+
+        leaves = nodes - (self.leaves - 1)
+        other = leaves != own_leaves[query_rows]
+        query_rows, leaves = query_rows[other], leaves[other]
+        squared, rows = self.leaf_candidates(queries, query_rows, leaves, exclude_rows)
+
+        # Keep the closest candidate per query; ties go to the own leaf, then to the lower row
+        closer = squared < best_squared[query_rows]
+        query_rows, squared, rows = query_rows[closer], squared[closer], rows[closer]
+        order = np.lexsort((rows, squared, query_rows))
+        first = order[np.append(True, query_rows[order][1:] != query_rows[order][:-1])] if len(order) else order
+        best_squared[query_rows[first]] = squared[first]
+        best_rows[query_rows[first]] = rows[first]
+
+        best_rows[~np.isfinite(best_squared)] = -1
+        return best_rows, best_squared
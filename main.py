@@ -1,88 +1,142 @@
+import argparse # Import argparse for the command line options
+import json # Import json for the machine-readable results
+import os
+import sys
 import time # Import time module for measuring execution time
 from math import log10
 
-from clustering_with_centroids import clustering_with_centroids  # Import centroid-based clustering algorithm
-from clustering_with_medoids import clustering_with_medoids  # Import k-medoids clustering algorithm
-from plotter import plot_points, plot_clusters  # Import functions for visualizing points and clusters
-from util import generate_points, compute_distance  # Import function to generate random points
+import numpy as np  # Import numpy for writing the labels
 
+from evaluation import evaluate  # Import the vectorized cluster quality evaluation
+from model import ClusterModel, methods  # Import the cluster model written with --output-dir and the pipelines
+from util import generate_points, read_point_file  # Import functions to generate and to read points
+
+# The plotter, and with it matplotlib, is only imported when plots are drawn
+
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(description="Cluster generated points or a point file with centroids and medoids.")
+    parser.add_argument("-k", "--k", type=int, default=20, help="number of clusters")
+    parser.add_argument("--points", type=int, default=20_000, help="number of generated points besides the initial ones")
+    parser.add_argument("--initial-points", type=int, default=20, help="initial points the generated points grow around")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the generated points and of both algorithms")
+    parser.add_argument("--input", help="binary point file (see util.write_point_file) clustered instead of generated points")
+    parser.add_argument("--algorithms", nargs="+", choices=list(methods), default=list(methods))
+    parser.add_argument("--workers", type=int, default=None, help="workers of the chunk stage, sequential by default")
+    parser.add_argument("--max-distance", type=float, default=500, help="limit on the mean distance of a cluster's points to its center")
+    parser.add_argument("--no-plot", action="store_true", help="draw no plots; matplotlib is then never imported")
+    parser.add_argument("--plot-dir", help="write the plots as PNG files into this directory instead of showing them")
+    parser.add_argument("--output-dir", help="write the labels (<algorithm>_labels.npy) and the model (<algorithm>_model.npz) of every algorithm into this directory")
+    parser.add_argument("--stats", action="store_true", help="add the operation counters and phase timers of a second, instrumented run of every algorithm to the JSON")
+    parser.add_argument("--json", help="write the results and timings as JSON to this file, '-' for stdout; the progress lines then go to stderr")
+    return parser.parse_args(arguments)
+
+
+def load_points(arguments):
+    """Returns the memory-mapped points of the input file, or generated points as a list of tuples."""
+    if arguments.input:
+        return read_point_file(arguments.input)
 
-def main():
-    # Configuration for the clustering task
-    k = 20  # Number of clusters
-    random_points = 20_000  # Total number of points to generate
-    fig_size_value = int(5 * log10(random_points))
-    fig_size = (fig_size_value, fig_size_value) # Size of the plot for visualizations
-    initial_points = 20 # Number of initial points to generate
     min_range, max_range = -5000, 5000  # Range for the x and y coordinates
     min_interval, max_interval = -100, 100  # Interval for random offsets applied to points
     x_range = (min_range, max_range)    # x-coordinate range
     y_range = (min_range, max_range)    # y-coordinate range
     x_interval = (min_interval, max_interval)   # x-coordinate offset range
     y_interval = (min_interval, max_interval)   # y-coordinate offset range
-    max_distance_allowed = 500
-
-    points = set()  # Initialize an empty set to store the generated points
 
     # Generate points in the given ranges and with specified intervals
-    generate_points(points, initial_points, random_points + initial_points, x_range, y_range, x_interval, y_interval)
-
-    print(f"Input data: points = {len(points)}, clusters = {k}")
-
-    # Plot the generated points
-    plot_points(points, fig_size)
-
-    # print("Provide k:")
-    # k = int(input())
-
+    points = generate_points(arguments.initial_points, arguments.points + arguments.initial_points, x_range, y_range,
+                             x_interval, y_interval, seed=arguments.seed)
+    return [tuple(point) for point in points.tolist()]   # Convert the array into point tuples
 
-    # Measure the time taken for clustering with centroids
-    start_time = int(time.time() * 1000)
-    solution_a = clustering_with_centroids(points, k)   # Perform clustering with centroids
-    print(f"Clustering with centroids: {(int(time.time() * 1000) - start_time) / 1000} s")  # Print time taken
 
-    flag = True
-    for cluster, cluster_points in solution_a.items():
-        flag = False if sum([compute_distance(cluster, point) for point in cluster_points]) / len(cluster_points) > max_distance_allowed else True
-        if not flag:
-            break
+def plot_results(points, results, arguments):
+    """Plots the points and the clusters of every algorithm, on screen or into the plot directory."""
+    from plotter import plot_points, plot_clusters  # Import functions for visualizing points and clusters
 
-    print("Clustering with centroids: success" if flag else "Clustering with centroids: fail")
-
-    # Measure the time taken for clustering with medoids
-    start_time = int(time.time() * 1000)
-    solution_b = clustering_with_medoids(points, k)   # Perform clustering with medoids
-    print(f"Clustering with medoids: {(int(time.time() * 1000) - start_time) / 1000} s")    # Print time taken
-
-    flag = True
-    for cluster, cluster_points in solution_b.items():
-        flag = False if sum([compute_distance(cluster, point) for point in cluster_points]) / len(cluster_points) > max_distance_allowed else True
-        if not flag:
-            break
-
-    print("Clustering with medoids: success" if flag else "Clustering with medoids: fail")
-
-    # Plot the results of clustering with centroids
-    labels_a = []
-    for point in points:
-        for idx, (cluster, cluster_points) in enumerate(solution_a.items()):
-            if point in cluster_points:
-                labels_a.append(idx)
-
-
-    plot_clusters(solution_a.keys(), points, labels_a, fig_size)
-
-
-    # Plot the results of clustering with medoids
-    labels_b = []
-    for point in points:
-        for idx, (cluster, cluster_points) in enumerate(solution_b.items()):
-            if point in cluster_points:
-                labels_b.append(idx)
-
-    plot_clusters(solution_b.keys(), points, labels_b, fig_size)
+    fig_size_value = int(5 * log10(max(len(points), 10)))
+    fig_size = (fig_size_value, fig_size_value) # Size of the plot for visualizations
 
+    def path_of(name):
+        return os.path.join(arguments.plot_dir, f"{name}.png") if arguments.plot_dir else None
+
+    # Plot the input points, then the results of every algorithm
+    plot_points(points, fig_size, path=path_of("points"))
+    for name, (labels, centers) in results.items():
+        plot_clusters(centers, points, labels, fig_size, title=f"Clustering with {name}", path=path_of(name))
+
+
+def main(arguments=None):
+    arguments = parse_arguments(arguments)
+    output = sys.stderr if arguments.json == "-" else sys.stdout    # Progress lines stay out of JSON on stdout
+    k = arguments.k  # Number of clusters
+
+    start_time = time.perf_counter()
+    points = load_points(arguments)
+    load_time = time.perf_counter() - start_time
+    dimensions = points.shape[1] if arguments.input else 2
+
+    print(f"Input data: points = {len(points)}, clusters = {k}", file=output)
+
+    results = {}
+    report = {
+        "input": {"source": arguments.input or "generated", "points": len(points), "dimensions": dimensions,
+                  "seed": arguments.seed},
+        "k": k,
+        "max_distance_allowed": arguments.max_distance,
+        "timings": {"load": load_time},
+        "results": {},
+    }
+    for name in arguments.algorithms:
+        # Measure the time taken for clustering
+        start_time = time.perf_counter()
+        _, labels, centers = methods[name](points, k, workers=arguments.workers, seed=arguments.seed, return_labels=True)
+        elapsed = time.perf_counter() - start_time
+        print(f"Clustering with {name}: {elapsed:.3f} s", file=output)  # Print time taken
+
+        # Every cluster's mean distance to its center has to be within max_distance_allowed
+        evaluation = evaluate(points, labels, centers, arguments.max_distance)
+        print(f"Clustering with {name}: {'success' if evaluation['success'] else 'fail'}", file=output)
+
+        results[name] = (labels, centers)  # The clusters themselves are not kept for the plots
+        report["timings"][name] = elapsed
+        report["results"][name] = {
+            "seconds": elapsed,
+            "clusters": len(centers),
+            "sizes": evaluation["sizes"].tolist(),
+            "inertia": evaluation["inertia"],
+            "max_mean_distance": evaluation["max_mean_distance"],
+            "success": bool(evaluation["success"]),
+            "centers": centers.tolist(),
+        }
+        if arguments.stats:
+            # Instrumentation slows the run down, so the timed run above is left without it
+            *_, stats = methods[name](points, k, workers=arguments.workers, seed=arguments.seed, return_labels=True,
+                                      return_stats=True)
+            report["results"][name].update(stats.as_dict())
+
+        if arguments.output_dir:
+            os.makedirs(arguments.output_dir, exist_ok=True)
+            labels_path = os.path.join(arguments.output_dir, f"{name}_labels.npy")
+            model_path = os.path.join(arguments.output_dir, f"{name}_model.npz")
+            np.save(labels_path, labels)
+            ClusterModel(centers, name).save(model_path)
+            report["results"][name].update(labels=labels_path, model=model_path)
+
+    if not arguments.no_plot:
+        if arguments.plot_dir:
+            os.makedirs(arguments.plot_dir, exist_ok=True)
+        start_time = time.perf_counter()
+        plot_results(points, results, arguments)
+        report["timings"]["plot"] = time.perf_counter() - start_time
+
+    if arguments.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif arguments.json:
+        with open(arguments.json, "w") as file:
+            json.dump(report, file, indent=2)
 
 
 if __name__ == '__main__':
-    main()  # Run the main function if this script is executed directly
\ No newline at end of file
+    main()  # Run the main function if this script is executed directly
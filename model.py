@@ -0,0 +1,83 @@
+import numpy as np  # Import numpy for the center arrays and the batched prediction
+
+from clustering_with_centroids import clustering_with_centroids
+from clustering_with_medoids import clustering_with_medoids
+from util import as_point_array, nearest_center_labels
+
+model_format = 1    # Version of the saved model layout
+
+methods = {     # Pipeline of every method name, shared by incremental.py, main.py and the benchmarks
+    "centroids": clustering_with_centroids,
+    "medoids": clustering_with_medoids,
+}
+
+
+class ClusterModel:
+    """
+        Fitted cluster centers with a vectorized nearest-center prediction (see util.nearest_center_labels).
+        """
+    def __init__(self, centers, method=None):
+        """
+            Parameters:
+                centers: (k, d) array or sequence of the cluster centers, row j being the center of label j.
+                method: Name of the pipeline that produced the centers, kept as metadata.
+            """
+        self.centers = np.ascontiguousarray(as_point_array(centers))
+        self.method = method
+
+    def __repr__(self):
+        return f"ClusterModel(k={len(self.centers)}, method={self.method!r})"
+
+    def __len__(self):
+        return len(self.centers)
+
+    @classmethod
+    def fit(cls, points, k, method="centroids", **options):
+        """
+            Clusters the points with one of the pipelines and returns the model of the resulting centers.
+
+            Parameters:
+                points: Collection of points (x, y), or an (n, d) array.
+                k: Number of clusters.
+                method: "centroids" or "medoids".
+                options: Further keyword arguments of the pipeline, e.g. seed or workers.
+            """
+        if method not in methods:
+            raise ValueError(f"Unknown method {method!r}, expected one of {', '.join(methods)}")
+        _, _, centers = methods[method](points, k, return_labels=True, **options)
+        return cls(centers, method)
+
+    @classmethod
+    def from_clusters(cls, clusters, method=None):
+        """Builds the model from a dictionary returned by a pipeline, label j being its j-th key."""
+        return cls(list(clusters.keys()), method)
+
+    def predict(self, points, block_elements=2_000_000):
+        """
+            Labels every point with the index of its closest center.
+
+            Parameters:
+                points: (n, d) array or sequence of points, e.g. a memory-mapped point file.
+                block_elements: Upper bound on the entries of one points x centers score block.
+
+            Returns:
+                An array with the label of every point.
+            """
+        if isinstance(points, (set, frozenset)):
+            points = list(points)
+        if not isinstance(points, np.ndarray):
+            points = as_point_array(points)
+
+        return nearest_center_labels(points, self.centers, max(1, block_elements // max(len(self.centers), 1)))
+
+    def save(self, path):
+        """Writes the model to a .npz file."""
+        np.savez(path, format=model_format, centers=self.centers, method=np.array(self.method or ""))
+
+    @classmethod
+    def load(cls, path):
+        """Reads a model written by save."""
+        with np.load(path) as data:
+            if int(data["format"]) != model_format:
+                raise ValueError(f"{path} holds model format {int(data['format'])}, expected {model_format}")
+            return cls(data["centers"], str(data["method"]) or None)
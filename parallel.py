@@ -0,0 +1,90 @@
+import random
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np  # Import numpy for seed derivation and compact chunk serialization
+
+import instrumentation
+
+executors = {
+    "process": ProcessPoolExecutor,
+    "thread": ThreadPoolExecutor,
+}
+
+
+def chunk_seeds(seed, amount):
+    """
+        Derives one independent seed per chunk from a single seed.
+
+        Parameters:
+            seed: The seed of the whole run, or None for unseeded runs.
+            amount: Number of chunks.
+
+        Returns:
+            A list of integer seeds, or a list of None if seed is None.
+        """
+    if seed is None:
+        return [None] * amount
+    return [int(state) for state in np.random.SeedSequence(seed).generate_state(amount)]
+
+
+def chunk_rng(seed):
+    """Returns a random generator for a chunk seed, or the shared random module for None."""
+    return random.Random(seed) if seed is not None else random
+
+
+def pack_points(points):
+    """Packs a list of point tuples into an array, which pickles as one buffer instead of a tuple per point."""
+    return np.asarray(points)
+
+
+def unpack_points(array):
+    """Converts an array packed by pack_points back into a list of point tuples."""
+    return [tuple(point) for point in array.tolist()]
+
+
+def instrumented_call(call):
+    """Runs function(task) with instrumentation in a worker process and returns the result and its stats."""
+    function, task = call
+    with instrumentation.recording() as stats:
+        result = function(task)
+    return result, stats
+
+
+def run_chunks(function, tasks, workers = None, executor = "process", initializer = None, initargs = ()):
+    """
+        Applies function to every task, optionally on a pool of workers.
+
+        Parameters:
+            function: A picklable module-level function taking one task.
+            tasks: List of task arguments.
+            workers: Number of workers; None or 1 runs the tasks sequentially in this process.
+            executor: "process" or "thread".
+            initializer: Optional function called with initargs in every worker process before the tasks,
+              or once in this process for threads and sequential runs, e.g. to share state between tasks.
+
+        Returns:
+            The list of results in task order.
+
+        When instrumentation is enabled, every worker process records its own stats, which are
+        merged into the active stats; threads record into the active stats directly.
+        """
+    if executor not in executors:
+        raise ValueError(f"Unknown executor {executor!r}, expected one of {', '.join(executors)}")
+
+    sequential = workers is None or workers <= 1 or len(tasks) <= 1
+    if initializer is not None and (sequential or executor != "process"):
+        initializer(*initargs)
+
+    if sequential:
+        return [function(task) for task in tasks]
+
+    pool_options = {"initializer": initializer, "initargs": initargs} if executor == "process" else {}
+    with executors[executor](max_workers=min(workers, len(tasks)), **pool_options) as pool:
+        if instrumentation.active is None or executor != "process":
+            return list(pool.map(function, tasks))
+
+        results = []
+        for result, stats in pool.map(instrumented_call, [(function, task) for task in tasks]):
+            instrumentation.active.merge(stats)
+            results.append(result)
+        return results
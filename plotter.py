@@ -1,37 +1,172 @@
-from matplotlib import pyplot as plt    # Import the pyplot module from matplotlib for plotting
+import numpy as np  # Import numpy for the coordinate arrays and the rasterization
+from matplotlib import colormaps   # Import the colormaps used to color the clusters
+from matplotlib.figure import Figure    # Import Figure for rendering to files without a display
 
+from util import as_point_array
 
-def plot_points(arr, figsize = (50, 50), title='Initial points'):
+
+def as_array(points):
+    """Converts a collection of points into an (n, 2) float array, keeping the first two coordinates of d-dimensional points."""
+    return as_point_array(points)[:, :2]
+
+
+def new_figure(figsize, path):
+    """Creates a figure, detached from pyplot when it is only written to a file."""
+    if path is not None:
+        return Figure(figsize=figsize)
+
+    from matplotlib import pyplot as plt    # Only the interactive display needs pyplot and a GUI backend
+    return plt.figure(figsize=figsize)
+
+
+def finish(figure, path, dpi):
+    """Writes the figure to path, or displays it if no path is given."""
+    if path is not None:
+        figure.savefig(path, dpi=dpi)
+        return
+
+    from matplotlib import pyplot as plt
+    plt.show()  # Display the plot
+
+
+def raster_pixels(points, bounds, resolution):
+    """
+        Maps every point to the index of its pixel in an image covering bounds.
+
+        Parameters:
+            points: (n, 2) array of points.
+            bounds: (x_min, x_max, y_min, y_max) covered by the image.
+            resolution: Number of pixels along the longer side of the image.
+
+        Returns:
+            The pixel index of every point and the (height, width) of the image.
+        """
+    x_min, x_max, y_min, y_max = bounds
+    scale = resolution / max(x_max - x_min, y_max - y_min, 1e-9)
+    width = max(1, int(np.ceil((x_max - x_min) * scale)))
+    height = max(1, int(np.ceil((y_max - y_min) * scale)))
+
+    columns = np.minimum(((points[:, 0] - x_min) * scale).astype(np.int64), width - 1)
+    rows = np.minimum(((points[:, 1] - y_min) * scale).astype(np.int64), height - 1)
+    return rows * width + columns, (height, width)
+
+
+def data_bounds(*arrays):
+    """Returns the (x_min, x_max, y_min, y_max) bounding box of all given point arrays."""
+    stacked = np.concatenate(arrays)
+    if not len(stacked):
+        return 0.0, 1.0, 0.0, 1.0
+    x_min, y_min = stacked.min(axis=0)
+    x_max, y_max = stacked.max(axis=0)
+    return x_min, x_max, y_min, y_max
+
+
+def density_image(points, bounds, resolution, color):
+    """
+        Rasterizes points into an RGBA image whose opacity grows with the logarithm of the points per pixel.
+
+        The points are binned once, everything after that scales with the number of pixels.
+        """
+    pixels, shape = raster_pixels(points, bounds, resolution)
+    density = np.log1p(np.bincount(pixels, minlength=shape[0] * shape[1]).astype(float))
+
+    image = np.zeros((shape[0] * shape[1], 4))
+    image[:, :3] = color[:3]
+    image[:, 3] = 0.35 + 0.65 * density / density.max() if density.max() > 0 else 0.0
+    image[density == 0, 3] = 0.0
+    return image.reshape(shape[0], shape[1], 4)
+
+
+def label_image(points, labels, bounds, resolution, colormap):
+    """
+        Rasterizes labelled points into an RGBA image in which every pixel takes the color of its most frequent label.
+
+        Parameters:
+            points: (n, 2) array of points.
+            labels: Array with the cluster label of every point.
+            bounds: (x_min, x_max, y_min, y_max) covered by the image.
+            resolution: Number of pixels along the longer side of the image.
+            colormap: Matplotlib colormap the labels are spread over.
+        """
+    pixels, shape = raster_pixels(points, bounds, resolution)
+    labels = np.asarray(labels, dtype=np.int64)
+    k = int(labels.max()) + 1 if len(labels) else 1
+
+    # Count every (pixel, label) pair and keep the label with the largest count per pixel
+    keys = np.sort(pixels * k + labels)
+    starts = np.flatnonzero(np.append(True, keys[1:] != keys[:-1]))
+    pairs, counts = keys[starts], np.diff(np.append(starts, len(keys)))
+    pair_pixels, pair_labels = pairs // k, pairs % k
+    best = np.zeros(shape[0] * shape[1], dtype=np.int64)
+    np.maximum.at(best, pair_pixels, counts)
+    dominant = counts == best[pair_pixels]
+
+    image = np.zeros((shape[0] * shape[1], 4))
+    image[pair_pixels[dominant]] = colormap(pair_labels[dominant] / max(k - 1, 1))
+    return image.reshape(shape[0], shape[1], 4)
+
+
+def plot_points(arr, figsize = (50, 50), title='Initial points', path=None, max_points=100_000, resolution=1_000, dpi=100):
     """
         Plot the initial set of points.
 
         Parameters:
-        - arr: List of points to be plotted.
+        - arr: List or (n, 2) array of points to be plotted.
         - figsize: Size of the plot (default is (50, 50)).
         - title: Title of the plot (default is 'Initial points').
+        - path: File the plot is written to, e.g. a PNG, without a display; by default the plot is shown.
+        - max_points: Above this many points they are drawn as a density image instead of markers.
+        - resolution: Number of pixels along the longer side of the density image.
+        - dpi: Resolution of the written file.
         """
-    plt.figure(figsize=figsize) # Create a figure with the specified size
-    # Scatter plot of points, using the x and y coordinates of the points in 'arr'
-    plt.scatter([i[0] for i in arr], [i[1] for i in arr], c='blue')
-    plt.title(title)    # Set the title of the plot
-    plt.show()  # Display the plot
+    points = as_array(arr)
+    figure = new_figure(figsize, path) # Create a figure with the specified size
+    axes = figure.add_subplot()
 
+    if len(points) > max_points:
+        # Past the threshold the drawing cost depends on the image size instead of the number of points
+        bounds = data_bounds(points)
+        axes.imshow(density_image(points, bounds, resolution, colormaps["Blues"](1.0)), origin="lower",
+                    extent=bounds, aspect="auto", interpolation="nearest")
+    else:
+        # Scatter plot of points, using the x and y coordinates of the points in 'arr'
+        axes.scatter(points[:, 0], points[:, 1], c='blue')
 
-def plot_clusters(clusters, points, labels, figsize = (50, 50), title='Clusters'):
+    axes.set_title(title)    # Set the title of the plot
+    finish(figure, path, dpi)
+
+
+def plot_clusters(clusters, points, labels, figsize = (50, 50), title='Clusters', path=None, max_points=100_000,
+                  resolution=1_000, dpi=100):
     """
         Plot the clusters, with points colored according to their cluster label and medoids marked.
 
         Parameters:
         - clusters: The cluster centers (medoids) to be plotted.
-        - points: List of points to be plotted.
-        - labels: List of labels corresponding to the points, indicating their cluster assignment.
+        - points: List or (n, 2) array of points to be plotted.
+        - labels: List or array of labels corresponding to the points, indicating their cluster assignment.
         - figsize: Size of the plot (default is (50, 50)).
         - title: Title of the plot (default is 'Clusters').
+        - path: File the plot is written to, e.g. a PNG, without a display; by default the plot is shown.
+        - max_points: Above this many points each pixel is colored by its most frequent label instead of drawing markers.
+        - resolution: Number of pixels along the longer side of the label image.
+        - dpi: Resolution of the written file.
         """
-    plt.figure(figsize=figsize) # Create a figure with the specified size
-    # Scatter plot of the points, with color representing their assigned cluster label
-    plt.scatter([i[0] for i in points], [i[1] for i in points], c=labels, cmap="tab20b")
+    points = as_array(points)
+    centers = as_array(clusters)
+    figure = new_figure(figsize, path) # Create a figure with the specified size
+    axes = figure.add_subplot()
+
+    if len(points) > max_points:
+        # Past the threshold the drawing cost depends on the image size instead of the number of points
+        bounds = data_bounds(points, centers)
+        axes.imshow(label_image(points, labels, bounds, resolution, colormaps["tab20b"]), origin="lower",
+                    extent=bounds, aspect="auto", interpolation="nearest")
+    else:
+        # Scatter plot of the points, with color representing their assigned cluster label
+        axes.scatter(points[:, 0], points[:, 1], c=labels, cmap="tab20b")
+
     # Scatter plot of the medoids (cluster centers) with a black color and larger size
-    plt.scatter([i[0] for i in clusters], [i[1] for i in clusters], s=100, c="black")
-    plt.title(title)    # Set the title of the plot
-    plt.show()  # Display the plot
\ No newline at end of file
+    axes.scatter(centers[:, 0], centers[:, 1], s=100, c="black")
+    axes.set_title(title)    # Set the title of the plot
+    finish(figure, path, dpi)
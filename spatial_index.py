@@ -0,0 +1,322 @@
+import heapq    # Import heapq for the k-nearest neighbours search
+import math     # Import math module for the cell size computation
+
+import numpy as np  # Import numpy for the batched nearest neighbour queries
+
+import instrumentation
+from util import dimensions_of, point_distances, squared_distance
+
+
+class GridIndex:
+    """
+        Uniform grid over 2D points supporting nearest neighbour, k-nearest neighbours and radius queries.
+
+        Points are bucketed into square cells of side cell_size. A query visits the rings of cells
+        around the query point and stops as soon as no unvisited cell can hold a closer point, so the
+        cost depends on the local density instead of the total number of points. Every point carries
+        an optional payload (the cluster points), mirroring the points of an AVLNode.
+        """
+    def __init__(self, cell_size):
+        self.cell_size = float(cell_size)
+        self.cells = {}     # (cell x, cell y) -> {point: payload}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, point):
+        return point in self.cells.get(self.cell_of(point), ())
+
+    def __iter__(self):
+        for bucket in self.cells.values():
+            yield from bucket
+
+    def cell_of(self, point):
+        """Returns the coordinates of the cell holding the point."""
+        return math.floor(point[0] / self.cell_size), math.floor(point[1] / self.cell_size)
+
+    def payload(self, point):
+        """Returns the payload stored with the point."""
+        return self.cells[self.cell_of(point)][point]
+
+    def items(self):
+        """Returns a list of (point, payload) pairs."""
+        return [item for bucket in self.cells.values() for item in bucket.items()]
+
+    def insert(self, x, y, points=None):
+        """Inserts the point (x, y) with its payload, replacing the payload of an existing equal point."""
+        bucket = self.cells.setdefault(self.cell_of((x, y)), {})
+        if (x, y) not in bucket:
+            self.size += 1
+        bucket[(x, y)] = points if points is not None else []
+
+    def remove(self, point):
+        """Removes the point from the grid and returns its payload, or None if it is not present."""
+        cell = self.cell_of(point)
+        bucket = self.cells.get(cell)
+        if bucket is None or point not in bucket:
+            return None
+
+        payload = bucket.pop(point)
+        if not bucket:
+            del self.cells[cell]
+        self.size -= 1
+        return payload
+
+    def _ring(self, cell, radius):
+        """Yields the cells at Chebyshev distance radius from the given cell."""
+        cx, cy = cell
+        if radius == 0:
+            yield cell
+            return
+        for dx in range(-radius, radius + 1):
+            yield cx + dx, cy - radius
+            yield cx + dx, cy + radius
+        for dy in range(-radius + 1, radius):
+            yield cx - radius, cy + dy
+            yield cx + radius, cy + dy
+
+    def _candidate_buckets(self, point):
+        """
+            Yields (lower bound, bucket) pairs ring by ring around the point.
+
+            The lower bound is the smallest distance any point outside the rings visited so far can have.
+            When the rings would cover more cells than are occupied, all remaining buckets are yielded at once.
+            """
+        cell = self.cell_of(point)
+        radius = 0
+        while True:
+            if (2 * radius + 1) ** 2 > len(self.cells):
+                # Scanning the occupied cells is cheaper than walking empty rings
+                for other, bucket in self.cells.items():
+                    if max(abs(other[0] - cell[0]), abs(other[1] - cell[1])) >= radius:
+                        yield float("inf"), bucket
+                return
+
+            for other in self._ring(cell, radius):
+                bucket = self.cells.get(other)
+                if bucket:
+                    yield radius * self.cell_size, bucket
+            radius += 1
+            yield radius * self.cell_size - self.cell_size, None
+
+    def nearest(self, point, exclude_self=False):
+        """
+            Finds the closest point in the grid.
+
+            Parameters:
+                point: The query point (x, y).
+                exclude_self: Skip a stored point equal to the query, as find_closest does.
+
+            Returns:
+                A (point, distance) pair, or (None, inf) if the grid holds no other point.
+            """
+        if instrumentation.active is not None:
+            instrumentation.active.count("grid_nearest")
+
+        x, y = point[0], point[1]
+        best, best_squared = None, float("inf")
+        for bound, bucket in self._candidate_buckets(point):
+            if bucket is None:
+                if best_squared <= bound * bound:
+                    break
+                continue
+            for other in bucket:
+                if exclude_self and other == point:
+                    continue
+                # Compare squared distances, the square root is only taken for the result
+                squared = (other[0] - x) ** 2 + (other[1] - y) ** 2
+                if squared < best_squared or (squared == best_squared and other < best):
+                    best, best_squared = other, squared
+        return best, math.sqrt(best_squared)
+
+    def k_nearest(self, point, k, exclude_self=False):
+        """Returns the k closest (point, distance) pairs sorted by distance."""
+        heap = []   # Max-heap on squared distance holding the k best candidates
+        for bound, bucket in self._candidate_buckets(point):
+            if bucket is None:
+                if len(heap) == k and -heap[0][0] <= bound * bound:
+                    break
+                continue
+            for other in bucket:
+                if exclude_self and other == point:
+                    continue
+                squared = squared_distance(point, other)
+                if len(heap) < k:
+                    heapq.heappush(heap, (-squared, other))
+                elif squared < -heap[0][0]:
+                    heapq.heapreplace(heap, (-squared, other))
+        return sorted(((other, math.sqrt(-squared)) for squared, other in heap), key=lambda x: x[1])
+
+    def within_radius(self, point, radius):
+        """Returns all stored points within the given distance of the point."""
+        x_min, y_min = self.cell_of((point[0] - radius, point[1] - radius))
+        x_max, y_max = self.cell_of((point[0] + radius, point[1] + radius))
+
+        if (x_max - x_min + 1) * (y_max - y_min + 1) > len(self.cells):
+            buckets = self.cells.values()
+        else:
+            buckets = [self.cells[cell] for cell in
+                       ((cx, cy) for cx in range(x_min, x_max + 1) for cy in range(y_min, y_max + 1))
+                       if cell in self.cells]
+
+        candidates = [other for bucket in buckets for other in bucket]
+        if not candidates:
+            return []
+        # One vectorized distance evaluation for all candidates of the covered cells
+        within = point_distances(candidates, point) <= radius
+        return [other for other, inside in zip(candidates, within.tolist()) if inside]
+
+    def nearest_batch(self, points):
+        """
+            Finds the closest stored point for every query point.
+
+            Queries are grouped by cell and compared against the 3x3 block of cells around them in one
+            vectorized step. A result closer than one cell size is exact; the remaining queries, and cells
+            with only a few queries, fall back to nearest.
+
+            Parameters:
+                points: Sequence or array of query points.
+
+            Returns:
+                A list with the closest stored point for each query point, in input order.
+            """
+        queries = np.asarray(points, dtype=float).reshape(-1, 2)
+        result = [None] * len(queries)
+        instrumentation.count("grid_batch_queries", len(queries))
+        if self.size == 0:
+            return result
+
+        cells = np.floor(queries / self.cell_size).astype(np.int64)
+        order = np.lexsort((cells[:, 1], cells[:, 0]))
+        boundaries = np.flatnonzero(np.any(np.diff(cells[order], axis=0) != 0, axis=1)) + 1
+
+        for group in np.split(order, boundaries):
+            cx, cy = cells[group[0]]
+            candidates = [other for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                          for other in self.cells.get((cx + dx, cy + dy), ())]
+            # A handful of queries is answered faster without the vectorized step
+            if not candidates or len(group) < 8:
+                for i in group:
+                    result[i] = self.nearest(tuple(queries[i]))[0]
+                continue
+
+            # Squared distances between every query of the cell and every candidate
+            coordinates = np.asarray(candidates, dtype=float)
+            squared = ((queries[group, None, :] - coordinates[None, :, :]) ** 2).sum(axis=2)
+            closest = squared.argmin(axis=1)
+            exact = squared[np.arange(len(group)), closest] <= self.cell_size ** 2
+
+            for i, j, is_exact in zip(group, closest, exact):
+                result[i] = candidates[j] if is_exact else self.nearest(tuple(queries[i]))[0]
+
+        return result
+
+
+def build_grid(points, payloads=None, points_per_cell=2):
+    """
+        Builds a grid index sized so that an occupied cell holds about points_per_cell points.
+
+        Parameters:
+            points: Sequence of points (x, y).
+            payloads: Optional sequence of payloads aligned with points.
+            points_per_cell: Target average number of points per cell.
+
+        Returns:
+            A GridIndex holding all points.
+        """
+    points = list(points)
+    if points:
+        xs = [point[0] for point in points]
+        ys = [point[1] for point in points]
+        area = max(max(xs) - min(xs), 1) * max(max(ys) - min(ys), 1)
+        cell_size = math.sqrt(area * points_per_cell / len(points))
+    else:
+        cell_size = 1.0
+
+    # Clustered data leaves most of the bounding box empty, so shrink the cells until
+    # the occupied ones hold about points_per_cell points each
+    for _ in range(8):
+        occupied = len({(math.floor(x / cell_size), math.floor(y / cell_size)) for x, y in points})
+        if len(points) <= 2 * points_per_cell * occupied:
+            break
+        cell_size /= 2
+
+    grid = GridIndex(cell_size)
+    for i, point in enumerate(points):
+        grid.insert(*point, payloads[i] if payloads is not None else None)
+    return grid
+
+
+def spatial_chunks(points, chunk_size):
+    """
+        Splits points into spatially compact chunks by recursive median bisection.
+
+        Every cell of the partition holding more than chunk_size points is split at the median of its
+        wider side, so the chunks are balanced in size and each covers only a small region of the plane,
+        unlike chunks cut by position in the input. Cells are emitted in the order of the bisection,
+        neighbouring cells mostly following each other.
+
+        Parameters:
+            points: Sequence of points (x, y), or an (n, d) array, split at the median of its widest coordinate.
+            chunk_size: Largest number of points per chunk; every chunk holds at least half of it.
+
+        Returns:
+            A list of arrays with the rows of the points of every chunk.
+        """
+    # Arrays keep their dtype, a compact int32 array is not copied
+    coordinates = np.asarray(list(points) if isinstance(points, (set, frozenset)) else points)
+    coordinates = coordinates if coordinates.ndim == 2 else coordinates.reshape(-1, 2)
+    chunk_size = max(int(chunk_size), 1)
+
+    chunks = []
+    pending = [np.arange(len(coordinates))] if len(coordinates) else []
+    while pending:
+        rows = pending.pop()
+        if len(rows) <= chunk_size:
+            chunks.append(rows)
+            continue
+
+        cell = coordinates[rows]
+        axis = int((cell.max(axis=0).astype(float) - cell.min(axis=0)).argmax())
+        half = len(rows) // 2
+        order = np.argpartition(cell[:, axis], half)
+        # The upper half is pushed first, so the lower half is split and emitted before it
+        pending.append(rows[order[half:]])
+        pending.append(rows[order[:half]])
+    return chunks
+
+
+extent_epsilon = 1e-4   # Padding of every side of a chunk box, relative to the side of the bounding box of all points
+
+
+def chunk_representatives(points, chunks, k, oversample=8.0):
+    """
+        Chooses the number of clusters every spatial chunk is reduced to.
+
+        A chunk covering a small share of the occupied area can only intersect a few of the k final
+        clusters, so the chunks share about oversample * k representatives in proportion to the area of
+        their bounding boxes, each getting at least one and at most k. The sides of the boxes are measured
+        relative to the bounding box of all points, so the shares do not depend on the scale of the data,
+        and padded by extent_epsilon of it, so chunks of a single line or point still get a share. In d
+        dimensions the volume of a box is raised to the power 2 / d, which keeps the shares as even as in
+        the plane.
+
+        Parameters:
+            points: (n, d) array of points.
+            chunks: List of row arrays as returned by spatial_chunks.
+            k: Number of final clusters.
+            oversample: Total number of representatives as a multiple of k.
+
+        Returns:
+            A list with the number of representatives of every chunk.
+        """
+    if not chunks:
+        return []
+    lower = np.array([points[rows].min(axis=0) for rows in chunks], dtype=float)
+    upper = np.array([points[rows].max(axis=0) for rows in chunks], dtype=float)
+    extent = upper.max(axis=0) - lower.min(axis=0)
+    extent[extent == 0] = 1.0
+    areas = np.prod((upper - lower) / extent + extent_epsilon, axis=1) ** (2 / dimensions_of(points))
+    shares = np.ceil(oversample * k * areas / areas.sum()).astype(np.int64)
+    return [int(min(max(share, 1), k, len(rows))) for share, rows in zip(shares.tolist(), chunks)]
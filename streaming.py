@@ -0,0 +1,191 @@
+import itertools    # Import itertools for slicing batches off an iterator
+import statistics   # Import statistics for the absorption threshold
+
+import numpy as np  # Import numpy for the running summaries
+
+import instrumentation
+from avltree import build_tree
+from clustering_with_centroids import clustering_heap
+from spatial_index import build_grid
+from util import compute_summary_centroid, pairwise_distances
+
+
+def iter_batches(points, batch_size):
+    """
+        Yields the points in batches of at most batch_size as (m, 2) float arrays.
+
+        Parameters:
+            points: An iterator, generator or sequence of points, or an (n, 2) array.
+            batch_size: Maximum number of points per batch.
+        """
+    if isinstance(points, np.ndarray):
+        for start in range(0, len(points), batch_size):
+            yield np.asarray(points[start:start + batch_size], dtype=float)
+        return
+
+    iterator = iter(points)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield np.asarray(batch, dtype=float).reshape(-1, 2)
+
+
+def cell_summaries(points, limit):
+    """
+        Summarizes points by square cells, sized so that at most limit cells are occupied.
+
+        Parameters:
+            points: (m, 2) array of points.
+            limit: Maximum number of summaries.
+
+        Returns:
+            The (counts, sums, squares) arrays of the occupied cells.
+        """
+    extent = np.maximum(points.max(axis=0) - points.min(axis=0), 1.0)
+    cell_size = np.sqrt(extent[0] * extent[1] / limit)
+    while True:
+        cells, inverse = np.unique(np.floor(points / cell_size), axis=0, return_inverse=True)
+        if len(cells) <= limit:
+            break
+        cell_size *= 2
+
+    inverse = inverse.reshape(-1)
+    counts = np.bincount(inverse, minlength=len(cells)).astype(float)
+    sums = np.stack([np.bincount(inverse, weights=points[:, axis], minlength=len(cells)) for axis in range(2)], axis=1)
+    squares = np.bincount(inverse, weights=(points ** 2).sum(axis=1), minlength=len(cells))
+    return counts, sums, squares
+
+
+def condense(counts, sums, squares, target):
+    """
+        Merges summaries with the heap merge engine until at most target remain.
+
+        Parameters:
+            counts: Array with the number of points of every summary.
+            sums: (s, 2) array with the coordinate sums of every summary.
+            squares: Array with the sums of squared point norms of every summary.
+            target: Number of summaries to keep.
+
+        Returns:
+            The condensed (counts, sums, squares) arrays.
+        """
+    # Summaries sharing a centroid are merged upfront, the tree keys on the centroid
+    merged = {}
+    for count, (sum_x, sum_y), square in zip(counts.tolist(), sums.tolist(), squares.tolist()):
+        centroid = (sum_x / count, sum_y / count)
+        merged.setdefault(centroid, []).append((count, sum_x, sum_y, square))
+
+    root = build_tree(list(merged.keys()), list(merged.values()))
+    clusters = clustering_heap(root, target, centroid_of=compute_summary_centroid)
+
+    summaries = np.array([np.sum(cluster, axis=0) for cluster in clusters.values()], dtype=float).reshape(-1, 4)
+    return summaries[:, 0], summaries[:, 1:3], summaries[:, 3]
+
+
+def absorb_outliers(counts, sums, squares, min_count):
+    """
+        Adds every summary with fewer than min_count points to the closest larger summary.
+
+        The final merge compares centroids only, so an isolated summary of a few stray points would
+        otherwise survive as a cluster of its own and force two real clusters to merge instead.
+
+        Returns:
+            The (counts, sums, squares) arrays of the remaining summaries.
+        """
+    small = counts < min_count
+    if not small.any() or small.all():
+        return counts, sums, squares
+
+    large = np.flatnonzero(~small)
+    centroids = sums / counts[:, None]
+    closest = large[pairwise_distances(centroids[small], centroids[large]).argmin(axis=1)]
+
+    counts, sums, squares = counts.copy(), sums.copy(), squares.copy()
+    np.add.at(counts, closest, counts[small])
+    np.add.at(sums, closest, sums[small])
+    np.add.at(squares, closest, squares[small])
+    return counts[~small], sums[~small], squares[~small]
+
+
+def clustering_stream(points, k, batch_size=10_000, max_summaries=2_000, return_stats=False):
+    """
+        Streaming centroid clustering with memory bounded by the summary budget instead of the data size.
+
+        Points are consumed in batches. Every summary keeps the count, the coordinate sums and the sum of
+        squared norms of its points, as a BIRCH clustering feature, which gives its centroid and radius.
+        A point within twice the radius of the closest summary, or within the absorption threshold, is added
+        to it; any other point starts a new summary, and a flood of new points is first summarized by grid
+        cells so the heap merge never sees more than the budget. Whenever the summaries exceed max_summaries they are
+        condensed to half the budget with the heap merge engine and the threshold grows to half the typical
+        gap between the condensed summaries. Finally, summaries too small to be a cluster join their closest
+        larger summary and the rest are merged into k clusters by the same engine.
+
+        Parameters:
+            points: An iterator, generator or sequence of points (x, y), or an (n, 2) array.
+            k: Number of clusters.
+            batch_size: Number of points consumed at a time.
+            max_summaries: Maximum number of summaries kept between batches.
+            return_stats: Also return the instrumentation.Stats of the run, with the operation counters
+              and the "absorb", "condense" and "merge" phase timers.
+
+        Returns:
+            A dictionary mapping each centroid to the number of points in its cluster; with return_stats
+            a (clusters, stats) tuple.
+        """
+    if return_stats:
+        with instrumentation.recording() as stats:
+            clusters = clustering_stream(points, k, batch_size, max_summaries)
+        return clusters, stats
+
+    counts = np.empty(0)
+    sums = np.empty((0, 2))
+    squares = np.empty(0)
+    threshold = 0.0
+
+    for batch in iter_batches(points, batch_size):
+        instrumentation.count("stream_points", len(batch))
+        with instrumentation.phase("absorb"):
+            if len(counts):
+                centroids = sums / counts[:, None]
+                radii = np.sqrt(np.maximum(squares / counts - (centroids ** 2).sum(axis=1), 0.0))
+                keys = [tuple(centroid) for centroid in centroids.tolist()]
+                rows = {key: row for row, key in enumerate(keys)}
+                grid = build_grid(keys)
+
+                closest = np.array([rows[key] for key in grid.nearest_batch(batch)])
+                distances = np.sqrt(((batch - centroids[closest]) ** 2).sum(axis=1))
+                absorbed = distances <= np.maximum(threshold, 2 * radii[closest])
+
+                np.add.at(counts, closest[absorbed], 1)
+                np.add.at(sums, closest[absorbed], batch[absorbed])
+                np.add.at(squares, closest[absorbed], (batch[absorbed] ** 2).sum(axis=1))
+                batch = batch[~absorbed]
+
+            # Points that start new summaries are pre-aggregated by cells when they would flood the budget
+            if len(batch) > max_summaries // 2:
+                new_counts, new_sums, new_squares = cell_summaries(batch, max(1, max_summaries // 2))
+            else:
+                new_counts, new_sums, new_squares = np.ones(len(batch)), batch, (batch ** 2).sum(axis=1)
+
+            counts = np.concatenate([counts, new_counts])
+            sums = np.concatenate([sums, new_sums])
+            squares = np.concatenate([squares, new_squares])
+
+        if len(counts) > max_summaries:
+            with instrumentation.phase("condense"):
+                counts, sums, squares = condense(counts, sums, squares, max(k, max_summaries // 2))
+
+                keys = [tuple(centroid) for centroid in (sums / counts[:, None]).tolist()]
+                grid = build_grid(keys)
+                gaps = [grid.nearest(key, exclude_self=True)[1] for key in keys]
+                threshold = max(threshold, statistics.median(gaps) / 2) if len(keys) > 1 else threshold
+
+    if len(counts) == 0:
+        return {}
+
+    with instrumentation.phase("merge"):
+        # Summaries holding less than 0.1% of an average cluster are treated as outliers
+        counts, sums, squares = absorb_outliers(counts, sums, squares, counts.sum() / k / 1000)
+        counts, sums, squares = condense(counts, sums, squares, k)
+    return {(sum_x / count, sum_y / count): int(count) for count, (sum_x, sum_y) in zip(counts.tolist(), sums.tolist())}
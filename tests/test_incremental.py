@@ -0,0 +1,39 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from incremental import IncrementalClustering
+from util import generate_points, squared_distances
+
+
+def generated(amount, seed):
+    points = generate_points(20, amount, (-5000, 5000), (-5000, 5000), (-100, 100), (-100, 100), seed=seed)
+    return [tuple(point) for point in points.tolist()]
+
+
+def test_batches_keep_every_point_at_its_closest_center():
+    points = generated(5_000, 1)
+    state = IncrementalClustering(points[:4_000], 10, drift=1e9, seed=1)
+    for batch in range(3):
+        state.update(added=points[4_000 + 300 * batch:4_300 + 300 * batch], removed=points[300 * batch:300 * batch + 300])
+
+        members = list(state.labels)
+        labels = np.array([state.labels[point] for point in members])
+        active = np.flatnonzero(state.active)
+        distances = squared_distances(members, state.centers[active])
+        assert np.allclose(distances[np.arange(len(members)), np.searchsorted(active, labels)], distances.min(axis=1))
+
+
+def test_centers_follow_their_members_when_the_iterations_run_out():
+    points = generated(5_000, 3)
+    state = IncrementalClustering(points[:4_000], 10, drift=1e9, seed=3, max_iterations=1)
+    state.update(added=points[4_000:4_600], removed=points[:600])
+
+    occupied = state.counts > 0
+    assert np.allclose(state.centers[occupied], state.sums[occupied] / state.counts[occupied][:, None])
+    for label in np.flatnonzero(occupied):
+        distances = np.sqrt(squared_distances(state.member_array(label), state.centers[[label]]))
+        assert np.isclose(state.radii[label], distances.max())
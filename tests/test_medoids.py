@@ -0,0 +1,20 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from clustering_with_medoids import clustering_with_medoids
+
+
+def test_restarts_cluster_points_of_any_dimension():
+    rng = np.random.default_rng(0)
+    centers = rng.uniform(-1000, 1000, (5, 8))
+    points = centers[rng.integers(0, 5, 2_000)] + rng.normal(0, 20, (2_000, 8))
+
+    clusters, labels, medoids = clustering_with_medoids(points, 5, seed=1, restarts=2, return_labels=True)
+
+    assert medoids.shape == (5, 8)
+    assert len(labels) == len(points)
+    assert sum(len(members) for members in clusters.values()) == len(points)
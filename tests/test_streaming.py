@@ -0,0 +1,17 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streaming import clustering_stream
+from util import generate_points
+
+
+def test_clustering_stream_end_to_end():
+    # The workload of main.py; the summaries carry a squares column next to the coordinate sums
+    points = generate_points(20, 20_020, (-5000, 5000), (-5000, 5000), (-100, 100), (-100, 100), seed=1)
+    clusters = clustering_stream((tuple(point) for point in points.tolist()), 20, batch_size=2_000, max_summaries=500)
+
+    assert len(clusters) == 20
+    assert sum(clusters.values()) == len(points)
+    assert all(len(centroid) == 2 for centroid in clusters)
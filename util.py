@@ -1,7 +1,9 @@
 import math     # Import math module for mathematical functions (e.g., square root)
-import random   # Import random module for generating random numbers
+import struct   # Import struct for the header of binary point files
 
-import numpy as np  # Import numpy for random integer generation in specified ranges
+import numpy as np  # Import numpy for random integer generation and vectorized distances
+
+import instrumentation
 
 
 def compute_distance(point_a, point_b):
@@ -15,6 +17,9 @@ def compute_distance(point_a, point_b):
         Returns:
             The Euclidean distance between point_a and point_b.
         """
+    if instrumentation.active is not None:
+        instrumentation.active.count("compute_distance")
+
     # If either point is None, return infinity (indicating invalid distance)
     if point_a is None or point_b is None:
         return float("inf")
@@ -23,84 +28,463 @@ def compute_distance(point_a, point_b):
     return math.sqrt((point_a[0] - point_b[0]) ** 2 + (point_a[1] - point_b[1]) ** 2)
 
 
+def squared_distance(point_a, point_b):
+    """
+        Computes the squared Euclidean distance between two points.
+
+        It orders pairs of points like compute_distance does, without the square root, so it is used
+        wherever only the comparison matters. For integer coordinates it is exact.
+
+        Parameters:
+            point_a: Tuple representing the first point (x, y).
+            point_b: Tuple representing the second point (x, y).
+
+        Returns:
+            The squared Euclidean distance between point_a and point_b.
+        """
+    return (point_a[0] - point_b[0]) ** 2 + (point_a[1] - point_b[1]) ** 2
+
+
+def as_point_array(points):
+    """Converts a collection of points, including sets and dict views, into an (n, d) float array; empty input gives (0, 2)."""
+    points = points if isinstance(points, (np.ndarray, list, tuple)) else list(points)
+    array = np.asarray(points, dtype=float)
+    return array if array.ndim == 2 else array.reshape(-1, 2)
+
+
+def dimensions_of(points):
+    """Returns the number of coordinates of an (n, d) array of points; any other collection holds points (x, y)."""
+    return points.shape[1] if isinstance(points, np.ndarray) and points.ndim == 2 else 2
+
+
+class PointStore:
+    """
+        Array-backed store of distinct points.
+
+        The points are kept both as the original tuples, which the clustering results are made of, and as
+        one (n, d) float array the distance kernels work on. Points are addressed by their row.
+        """
+    def __init__(self, points):
+        """
+            Parameters:
+                points: Collection of distinct points (x, y), or an (n, d) array.
+            """
+        self.points = [tuple(point) for point in points.tolist()] if isinstance(points, np.ndarray) else list(points)
+        self.array = as_point_array(self.points)
+        self.row_of = None
+
+    def __len__(self):
+        return len(self.points)
+
+    def rows(self, points):
+        """Returns an array with the row of every given point of the store."""
+        if self.row_of is None:
+            self.row_of = {point: row for row, point in enumerate(self.points)}
+        return np.fromiter((self.row_of[point] for point in points), dtype=np.intp, count=len(points))
+
+    def take(self, rows):
+        """Returns the points of the given rows as a list of tuples."""
+        return [self.points[row] for row in rows]
+
+
+def squared_distances(points_a, points_b):
+    """
+        Computes the squared Euclidean distances between every pair of points of two sets in one vectorized step.
+
+        The coordinates are handled one axis at a time, so no (n, m, d) temporary is built.
+
+        Parameters:
+            points_a: Array or sequence of n points.
+            points_b: Array or sequence of m points.
+
+        Returns:
+            An (n, m) array of squared distances.
+        """
+    points_a = np.asarray(points_a, dtype=float)
+    points_b = np.asarray(points_b, dtype=float)
+    if instrumentation.active is not None:
+        instrumentation.active.count("vectorized_distances", len(points_a) * len(points_b))
+
+    distances = np.zeros((len(points_a), len(points_b)))
+    for axis in range(points_a.shape[1] if points_a.ndim == 2 else 0):
+        difference = points_a[:, axis, None] - points_b[None, :, axis]
+        difference *= difference
+        distances += difference
+    return distances
+
+
+def pairwise_distances(points_a, points_b):
+    """
+        Computes the Euclidean distances between every pair of points of two sets in one vectorized step.
+
+        Parameters:
+            points_a: Array or sequence of n points.
+            points_b: Array or sequence of m points.
+
+        Returns:
+            An (n, m) array of distances.
+        """
+    return np.sqrt(squared_distances(points_a, points_b))
+
+
+def point_distances(points, point):
+    """
+        Computes the Euclidean distances from every point of a set to one point.
+
+        Parameters:
+            points: (n, 2) array or sequence of points.
+            point: The point (x, y).
+
+        Returns:
+            An array with the distance of every point to point.
+        """
+    points = as_point_array(points)
+    if instrumentation.active is not None:
+        instrumentation.active.count("vectorized_distances", len(points))
+    return np.sqrt(((points - np.asarray(point, dtype=float)) ** 2).sum(axis=1))
+
+
+def distance_sums(points, candidates=None, block_elements=4_000_000):
+    """
+        Computes the sum of the distances from every candidate to all points, in blocks of candidates.
+
+        Parameters:
+            points: (n, 2) array or sequence of points.
+            candidates: (m, 2) array or sequence of candidates; by default the points themselves.
+            block_elements: Upper bound on the entries of one candidates x points distance block.
+
+        Returns:
+            An array with the distance sum of every candidate.
+        """
+    points = as_point_array(points)
+    candidates = points if candidates is None else as_point_array(candidates)
+    block_size = max(1, block_elements // max(len(points), 1))
+
+    sums = np.empty(len(candidates))
+    for start in range(0, len(candidates), block_size):
+        sums[start:start + block_size] = pairwise_distances(candidates[start:start + block_size], points).sum(axis=1)
+    return sums
+
+
+def cluster_costs(points, labels, centers):
+    """
+        Computes the sum of the distances of the points of every cluster to its center.
+
+        Parameters:
+            points: (n, 2) array of points.
+            labels: Array with the center index of every point.
+            centers: (k, 2) array or sequence of centers.
+
+        Returns:
+            An array with the cost of every cluster.
+        """
+    centers = as_point_array(centers)
+    if instrumentation.active is not None:
+        instrumentation.active.count("vectorized_distances", len(points))
+    distances = np.sqrt(((np.asarray(points, dtype=float) - centers[labels]) ** 2).sum(axis=1))
+    return np.bincount(labels, weights=distances, minlength=len(centers))
+
+
+def nearest_center_labels(points, centers, block_size=65_536):
+    """
+        Finds the index of the closest center of every point, processing the points in blocks.
+
+        The squared distance |x - c|^2 = |x|^2 - 2 x.c + |c|^2 orders the centers of a point like
+        |c|^2 - 2 x.c does, so every block is scored with one matrix product, without square roots.
+        Points and centers are first moved by the mean of the centers: far from the origin both terms
+        would be huge and cancel, and their rounding error would decide between close centers.
+        Integer blocks, e.g. of a compact int32 point file, are converted one block at a time.
+
+        Parameters:
+            points: (n, d) array of points, e.g. a memory-mapped point file.
+            centers: Sequence of k centers; a center with a non-finite coordinate is never chosen.
+            block_size: Number of points compared against the centers at a time.
+
+        Returns:
+            An array with the index of the closest center of every point.
+        """
+    centers = np.asarray(centers, dtype=float).reshape(len(centers), -1)
+    finite = np.isfinite(centers).all(axis=1)
+    reference = centers[finite].mean(axis=0) if finite.any() else np.zeros(centers.shape[1])
+    centers = np.where(finite[:, None], centers - reference, 0.0)
+    center_norms = np.where(finite, (centers ** 2).sum(axis=1), np.inf)
+
+    labels = np.empty(len(points), dtype=np.intp)
+    instrumentation.count("vectorized_distances", len(points) * len(centers))
+    for start in range(0, len(points), block_size):
+        block = np.asarray(points[start:start + block_size], dtype=float) - reference
+        scores = block @ (-2 * centers.T)
+        scores += center_norms
+        labels[start:start + block_size] = scores.argmin(axis=1)
+    return labels
+
+
+def closest_rows(points, queries, block_size=65_536):
+    """
+        Finds the row of the closest point of every query, processing the points in blocks.
+
+        Parameters:
+            points: (n, 2) array of points, e.g. a memory-mapped point file.
+            queries: Sequence of m query points.
+            block_size: Number of points compared against the queries at a time.
+
+        Returns:
+            An array with the row of the point closest to every query, the first one on ties.
+        """
+    queries = as_point_array(queries)
+    best_rows = np.zeros(len(queries), dtype=np.intp)
+    best_squared = np.full(len(queries), np.inf)
+    for start in range(0, len(points), block_size):
+        squared = squared_distances(np.asarray(points[start:start + block_size], dtype=float), queries)
+        rows = squared.argmin(axis=0)
+        closer = squared[rows, np.arange(len(queries))] < best_squared
+        best_rows[closer] = rows[closer] + start
+        best_squared[closer] = squared[rows[closer], np.flatnonzero(closer)]
+    return best_rows
+
+
+def group_by_label(points, labels, centers):
+    """
+        Groups the rows of a point array by label.
+
+        Parameters:
+            points: (n, 2) array of points.
+            labels: Array with the center index of every point.
+            centers: Sequence of k centers.
+
+        Returns:
+            A dictionary mapping each center with at least one point to an array of its points.
+        """
+    order = np.argsort(labels, kind="stable")
+    bounds = np.searchsorted(labels[order], np.arange(len(centers) + 1))
+    return {center: np.asarray(points[np.sort(order[bounds[j]:bounds[j + 1]])])
+            for j, center in enumerate(centers) if bounds[j + 1] > bounds[j]}
+
+
+def compact_labels(labels, centers):
+    """
+        Renumbers labels so that centers without any point are dropped.
+
+        Parameters:
+            labels: Array with the center index of every point.
+            centers: Sequence of k centers.
+
+        Returns:
+            The renumbered labels and an array of the remaining centers, row j being the center of label j.
+        """
+    used = np.bincount(labels, minlength=len(centers)) > 0
+    return (np.cumsum(used) - 1)[labels], as_point_array(centers)[used]
+
+
 def compute_centroid(cluster):
     """
         Computes the centroid (mean) of a cluster of points.
 
         Parameters:
-            cluster: List of tuples representing points in the cluster.
+            cluster: List of tuples representing points in the cluster, or an (n, 2) array.
 
         Returns:
             The coordinates (x, y) of the centroid of the cluster.
         """
-    # Extract the x and y coordinates of each point in the cluster
-    x_coordinates = [x[0] for x in cluster]
-    y_coordinates = [y[1] for y in cluster]
+    if isinstance(cluster, np.ndarray):
+        return tuple(cluster.mean(axis=0).tolist())
+
+    # Transpose the points into their x and y coordinates; for tuples this is faster than an array conversion
+    x_coordinates, y_coordinates = zip(*cluster)
 
     # Calculate and return the average of the x and y coordinates
     return sum(x_coordinates) / (len(cluster)), sum(y_coordinates) / (len(cluster))
 
 
-def generate_initial_points(points, amount, x_range, y_range):
+def compute_summary_centroid(summaries):
     """
-       Generates a set of initial random points within specified ranges.
+        Computes the centroid of a cluster described by summaries instead of points.
+
+        Parameters:
+            summaries: List of (count, sum of x, sum of y) summaries; further columns, such as the sum of
+              squared norms of the streaming summaries, are ignored.
+
+        Returns:
+            The coordinates (x, y) of the centroid of all summarized points.
+        """
+    count = sum(summary[0] for summary in summaries)
+    return sum(summary[1] for summary in summaries) / count, sum(summary[2] for summary in summaries) / count
+
+
+point_file_magic = b"PTS1"
+point_file_header = struct.Struct("<4sBBHQ")   # magic, version, dtype code, dimensions, number of points
+point_file_dtypes = {0: np.dtype("<i4"), 1: np.dtype("<f8")}
+
+
+def write_point_file(path, points, dtype=None):
+    """
+        Writes points to a compact binary point file.
+
+        The file is a 16 byte header (magic "PTS1", version, dtype code, dimensions, number of points)
+        followed by the coordinates as a row-major little-endian int32 or float64 array.
+
+        Parameters:
+            path: Path of the file to write.
+            points: Array or collection of points.
+            dtype: "int32" or "float64"; by default int32 if every coordinate is an integer that fits.
+        """
+    array = np.asarray(list(points) if isinstance(points, (set, frozenset)) else points)
+    array = array.reshape(len(array), -1) if array.size else np.empty((0, 2))
+
+    if dtype is None:
+        integral = np.issubdtype(array.dtype, np.integer) or (array.size and np.all(np.mod(array, 1) == 0))
+        fits = not array.size or (array.min() >= np.iinfo(np.int32).min and array.max() <= np.iinfo(np.int32).max)
+        dtype = "int32" if integral and fits else "float64"
+
+    code = {"int32": 0, "float64": 1}[dtype]
+    with open(path, "wb") as file:
+        file.write(point_file_header.pack(point_file_magic, 1, code, array.shape[1], len(array)))
+        file.write(np.ascontiguousarray(array, dtype=point_file_dtypes[code]).tobytes())
+
+
+def read_point_file(path, mmap=True):
+    """
+        Opens a binary point file written by write_point_file.
+
+        Parameters:
+            path: Path of the file.
+            mmap: Map the file instead of reading it, so points are only loaded when accessed.
+
+        Returns:
+            An (n, dimensions) read-only array view of the coordinates.
+        """
+    with open(path, "rb") as file:
+        magic, version, code, dimensions, amount = point_file_header.unpack(file.read(point_file_header.size))
+        if magic != point_file_magic or version != 1 or code not in point_file_dtypes:
+            raise ValueError(f"{path} is not a version 1 point file")
+
+        if not mmap:
+            return np.fromfile(file, dtype=point_file_dtypes[code], count=amount * dimensions).reshape(amount, dimensions)
+
+    if amount == 0:
+        return np.empty((0, dimensions), dtype=point_file_dtypes[code])
+    return np.memmap(path, dtype=point_file_dtypes[code], mode="r", offset=point_file_header.size, shape=(amount, dimensions))
+
+
+def point_keys(points, x_range, y_range):
+    """Encodes integer points within the ranges as one integer key per point, for fast deduplication."""
+    return (points[:, 0] - x_range[0]) * (y_range[1] - y_range[0] + 1) + (points[:, 1] - y_range[0])
+
+
+def add_new_points(points, keys, candidates, x_range, y_range, rng):
+    """
+        Appends the distinct candidates that are not among the points yet.
+
+        Parameters:
+            points: (n, 2) integer array of distinct points.
+            keys: Sorted array of the keys of the points.
+            candidates: (m, 2) integer array of points within the ranges.
+            rng: numpy Generator shuffling the new points, so that a truncated block is a random subset.
+
+        Returns:
+            The points followed by the new points, and the sorted keys of all of them.
+        """
+    candidate_keys = np.sort(point_keys(candidates, x_range, y_range))
+    candidate_keys = candidate_keys[np.append(True, candidate_keys[1:] != candidate_keys[:-1])]
+    positions = np.minimum(np.searchsorted(keys, candidate_keys), max(len(keys) - 1, 0))
+    new_keys = candidate_keys[keys[positions] != candidate_keys] if len(keys) else candidate_keys
+
+    # Decode the keys of the new points back into coordinates
+    height = y_range[1] - y_range[0] + 1
+    shuffled = rng.permutation(new_keys)
+    new_points = np.stack([shuffled // height + x_range[0], shuffled % height + y_range[0]], axis=1)
+    return np.concatenate([points, new_points]), np.sort(np.concatenate([keys, new_keys]))
+
+
+def generate_initial_points(amount, x_range, y_range, rng):
+    """
+       Generates distinct random initial points within specified ranges.
 
        Parameters:
-           points: A set to hold the generated points.
            amount: The number of points to generate.
            x_range: Tuple representing the range for x coordinates (min, max).
            y_range: Tuple representing the range for y coordinates (min, max).
+           rng: numpy Generator drawing the coordinates.
 
        Returns:
-           The updated set of points with the newly generated points.
+           An (amount, 2) integer array of distinct points and the sorted array of their keys.
        """
-    # Keep generating points until the set contains the specified amount of points
+    points = np.empty((0, 2), dtype=np.int64)
+    keys = np.empty(0, dtype=np.int64)
+
+    # Keep drawing until the array contains the specified amount of distinct points
     while len(points) < amount:
-        points.add((
-            np.random.randint(x_range[0], x_range[1] + 1),  # Random x within x_range
-            np.random.randint(y_range[0], y_range[1] + 1)   # Random y within y_rang
-        ))
+        candidates = np.stack([
+            rng.integers(x_range[0], x_range[1] + 1, amount),   # Random x within x_range
+            rng.integers(y_range[0], y_range[1] + 1, amount)    # Random y within y_range
+        ], axis=1)
+        points, keys = add_new_points(points, keys, candidates, x_range, y_range, rng)
 
-    # Return the updated set of points
-    return points
+    points = points[:amount]
+    return points, np.sort(point_keys(points, x_range, y_range))
 
 
-def generate_points(points, points_initial_amount, points_total_amount, x_range, y_range, x_interval, y_interval):
+def generate_points(points_initial_amount, points_total_amount, x_range, y_range, x_interval, y_interval, seed=None,
+                    dtype=np.int64):
     """
-        Generates a set of points by expanding initial points with random offsets.
+        Generates distinct integer points by expanding initial points with random offsets.
+
+        Every new point is a randomly selected earlier point moved by a random offset and clamped to the
+        ranges. Points are generated in blocks: a block draws its source points from all points generated
+        before it and is at most as large as they are, so the blobs grow around the initial points just as
+        with one point at a time, in O(n log n) instead of quadratic time.
 
         Parameters:
-            points: A set to hold the generated points.
             points_initial_amount: The number of initial points to generate.
             points_total_amount: The total number of points to generate.
             x_range: Tuple representing the range for x coordinates (min, max).
             y_range: Tuple representing the range for y coordinates (min, max).
             x_interval: Tuple representing the range for random x offsets.
             y_interval: Tuple representing the range for random y offsets.
+            seed: Seed of the random generator, None for a fresh random state.
+            dtype: Integer dtype of the result; np.int32 gives the compact 8 bytes per point layout.
 
         Returns:
-            The updated set of points with the newly generated points.
+            A (points_total_amount, 2) integer array of distinct points.
         """
+    if points_total_amount < 0:
+        raise ValueError(f"Cannot generate {points_total_amount} points")
+    if points_initial_amount < 1 and points_total_amount > 0:
+        raise ValueError(f"At least one initial point is needed to grow {points_total_amount} points around, "
+                         f"got {points_initial_amount}")
+
+    area = (x_range[1] - x_range[0] + 1) * (y_range[1] - y_range[0] + 1)
+    if points_total_amount > area:
+        raise ValueError(f"Cannot generate {points_total_amount} distinct points in a range of {area} points")
+
+    limits = np.iinfo(dtype)
+    if min(x_range[0], y_range[0]) < limits.min or max(x_range[1], y_range[1]) > limits.max:
+        raise ValueError(f"The ranges do not fit into {np.dtype(dtype).name} coordinates")
+
+    rng = np.random.default_rng(seed)
+
     # Generate the initial points in the specified range
-    generate_initial_points(points, points_initial_amount, x_range, y_range)
+    points, keys = generate_initial_points(min(points_initial_amount, points_total_amount), x_range, y_range, rng)
 
-    # Generate additional points by applying random offsets to existing points
+    # Generate additional points by applying random offsets to existing points; the blocks are enlarged
+    # by the share of new points that turned out to be distinct, so repeats rarely cost another block
+    accepted = 1.0
     while len(points) < points_total_amount:
-        random_point = random.choice(list(points))  # Randomly select an existing point
+        block = min(len(points), int((points_total_amount - len(points)) / accepted) + 1)
+        sources = points[rng.integers(0, len(points), block)]  # Randomly select existing points
 
         # Apply random offsets within the given intervals
-        x_offset = np.random.randint(x_interval[0], x_interval[1] + 1)
-        y_offset = np.random.randint(y_interval[0], y_interval[1] + 1)
+        offsets = np.stack([
+            rng.integers(x_interval[0], x_interval[1] + 1, block),
+            rng.integers(y_interval[0], y_interval[1] + 1, block)
+        ], axis=1)
 
-        # Calculate new x and y coordinates with the applied offsets
-        x = random_point[0] + x_offset
-        y = random_point[1] + y_offset
+        # Ensure that the new points are within the specified x and y range
+        new_points = np.clip(sources + offsets, [x_range[0], y_range[0]], [x_range[1], y_range[1]])
 
-        # Ensure that the new point is within the specified x and y range
-        new_point = (
-            x_range[0] if x < x_range[0] else (x_range[1] if x > x_range[1] else x),
-            y_range[0] if y < y_range[0] else (y_range[1] if y > y_range[1] else y)
-        )
+        # Add the new points, dropping those that already exist
+        previous_amount = len(points)
+        points, keys = add_new_points(points, keys, new_points, x_range, y_range, rng)
+        accepted = max((len(points) - previous_amount) / block, 0.01)
 
-        # Add the new point to the set of points
-        points.add(new_point)
\ No newline at end of file
+    return points[:points_total_amount].astype(dtype, copy=False)